@@ -2,8 +2,26 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import pdfplumber
+from pdfminer.pdftypes import PDFObjRef, PDFStream, resolve1
 import plotly.express as px
 import os
+import sys
+import tempfile
+import io
+import csv
+import time
+import codecs
+import json
+import re
+import hashlib
+import importlib.util
+import threading
+import zipfile
+import xml.etree.ElementTree as ET
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from collections import OrderedDict
 from scipy import stats
 import streamlit as st
 from st_paywall import add_auth
@@ -21,63 +39,1351 @@ st.write(f"Subscription Status: {st.session_state.user_subscribed}")
 st.write("🎉 Evviva! Tutto ok e sei iscritto!")
 st.write(f'A proposito, la tua email è: {st.session_state.email}')
 
+# Budget di memoria della cache dei file caricati (MB, configurabile via variabile d'ambiente)
+UPLOAD_CACHE_MB = int(os.environ.get("PYNAPP_UPLOAD_CACHE_MB", "512"))
+
+# Cache LRU con budget di memoria
+class LRUCache:
+    """
+    Cache LRU limitata in byte:
+    - ogni voce ha una dimensione stimata
+    - oltre il budget vengono eliminate le voci usate meno di recente
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._items = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._items:
+                return None
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, value, nbytes=None):
+        if nbytes is None:
+            nbytes = estimate_nbytes(value)
+        with self._lock:
+            if key in self._items:
+                del self._items[key]
+                self.total_bytes -= self._sizes.pop(key)
+            if nbytes > self.max_bytes:  # Troppo grande: non la teniamo
+                return False
+            self._items[key] = value
+            self._sizes[key] = nbytes
+            self.total_bytes += nbytes
+            while self.total_bytes > self.max_bytes:
+                old_key, _ = self._items.popitem(last=False)
+                self.total_bytes -= self._sizes.pop(old_key)
+            return True
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+# Stima dell'occupazione in memoria di un oggetto in cache
+def estimate_nbytes(obj):
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(index=True, deep=True).sum())
+    if isinstance(obj, (tuple, list)):
+        return sum(estimate_nbytes(o) for o in obj)
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    return 1024
+
+# Motori opzionali disponibili nell'ambiente
+HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+HAS_CALAMINE = importlib.util.find_spec("python_calamine") is not None
+HAS_ORJSON = importlib.util.find_spec("orjson") is not None
+
+# Byte letti per indovinare il formato di un CSV
+CSV_SNIFF_BYTES = 64 * 1024
+
+# Cache condivisa tra i rerun (e le sessioni) dei file già interpretati
+@st.cache_resource
+def get_upload_cache():
+    return LRUCache(UPLOAD_CACHE_MB * 1024 ** 2)
+
+# Impronta del contenuto di un file caricato
+def file_hash(file):
+    """Hash BLAKE2b dei byte del file, letto senza copiarlo."""
+    with file.getbuffer() as buf:
+        return hashlib.blake2b(buf, digest_size=16).hexdigest()
+
+# Rilevamento del formato CSV da un prefisso del file
+def sniff_csv_format(file, ext):
+    """
+    Legge solo i primi CSV_SNIFF_BYTES byte per indovinare:
+    - encoding (BOM, utf-8, altrimenti latin-1)
+    - separatore (tra , ; tab |)
+    - presenza della riga di intestazione
+    """
+    file.seek(0)
+    head = file.read(CSV_SNIFF_BYTES)
+    file.seek(0)
+
+    if head.startswith(codecs.BOM_UTF8):
+        encoding = "utf-8-sig"
+    elif head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        encoding = "utf-16"
+    else:
+        try:
+            head.decode("utf-8")
+            encoding = "utf-8"
+        except UnicodeDecodeError as e:
+            # Un carattere multibyte troncato alla fine del prefisso non conta
+            encoding = "utf-8" if e.start >= len(head) - 3 else "latin-1"
+
+    text = head.decode(encoding, errors="ignore")
+    if len(head) == CSV_SNIFF_BYTES and "\n" in text:
+        text = text[:text.rfind("\n")]  # L'ultima riga potrebbe essere troncata
+
+    default_sep = "\t" if ext == ".tsv" else ","
+    try:
+        sep = csv.Sniffer().sniff(text, delimiters=",;\t|").delimiter
+    except csv.Error:
+        sep = default_sep
+
+    # Intestazione assente solo se la prima riga è fatta tutta di numeri
+    first_row = next(csv.reader(io.StringIO(text), delimiter=sep), [])
+    header = not first_row or not all(_looks_numeric(v) for v in first_row)
+    return {"sep": sep, "encoding": encoding, "header": header}
+
+def _looks_numeric(value):
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
+
+# Lettura CSV veloce: pyarrow multithread, con il motore C come riserva
+def read_csv_fast(file, ext):
+    """Restituisce (DataFrame, motore usato)."""
+    fmt = sniff_csv_format(file, ext)
+    kwargs = dict(sep=fmt["sep"], encoding=fmt["encoding"], header=0 if fmt["header"] else None)
+    df, engine = None, None
+    if HAS_PYARROW:
+        try:
+            file.seek(0)
+            df, engine = pd.read_csv(file, engine="pyarrow", **kwargs), "pyarrow"
+        except Exception:
+            df = None
+    if df is None:
+        file.seek(0)
+        df, engine = pd.read_csv(file, engine="c", low_memory=False, **kwargs), "c"
+    if not fmt["header"]:
+        df.columns = [f"colonna_{i + 1}" for i in range(df.shape[1])]
+    return df, engine
+
+# Strumenti per sviluppatori (benchmark) nella pagina solo con PYNAPP_DEBUG=1
+DEBUG_TOOLS = os.environ.get("PYNAPP_DEBUG", "0") == "1"
+
+# Confronto tra la lettura CSV veloce e quella originale (motore Python)
+def benchmark_csv_loaders(n_rows=1_000_000):
+    """Genera un CSV sintetico con separatore ';' e misura i due percorsi di lettura."""
+    rng = np.random.default_rng(0)
+    synthetic = pd.DataFrame({
+        "id": np.arange(n_rows),
+        "valore": rng.normal(100, 15, n_rows).round(3),
+        "quantita": rng.integers(0, 1000, n_rows),
+        "categoria": rng.choice(["alfa", "beta", "gamma", "delta"], n_rows),
+    })
+    payload = synthetic.to_csv(index=False, sep=";").encode()
+
+    results = []
+    buf = io.BytesIO(payload)
+    start = time.perf_counter()
+    pd.read_csv(buf, sep=None, engine="python")
+    baseline = time.perf_counter() - start
+    results.append({"Percorso": "Originale (sep=None, python)", "Secondi": round(baseline, 3), "Speedup": 1.0})
+
+    buf = io.BytesIO(payload)
+    start = time.perf_counter()
+    _, engine = read_csv_fast(buf, ".csv")
+    elapsed = time.perf_counter() - start
+    results.append({"Percorso": f"Veloce ({engine})", "Secondi": round(elapsed, 3),
+                    "Speedup": round(baseline / elapsed, 1) if elapsed > 0 else float("inf")})
+    return pd.DataFrame(results)
+
 # Funzione di caricamento file
-def load_data(file):
-    name = file.name.lower()
-    ext = os.path.splitext(name)[-1]
+def load_data(file, options=None):
+    """
+    Carica il file usando la cache per contenuto:
+    a parità di byte (e di opzioni) il rerun restituisce il DataFrame già
+    interpretato, come copia superficiale senza duplicare i dati.
+    Restituisce (DataFrame, info sul caricamento).
+    """
+    options = options or {}
+    ext = os.path.splitext(file.name.lower())[-1]
+    key = (ext, file_hash(file), repr(sorted(options.items())))
+    cache = get_upload_cache()
+    cached = cache.get(key)
+    if cached is not None:
+        df, info = cached
+        return df.copy(deep=False), {**info, "cached": True}
+
+    start = time.perf_counter()
+    df, engine = _parse_file(file, ext, options)
+    if df is None:
+        return None, {}
+    info = {"engine": engine, "seconds": time.perf_counter() - start, "cached": False}
+    cache.put(key, (df, info))
+    return df.copy(deep=False), info
+
+# Interpretazione del file in base all'estensione
+def _parse_file(file, ext, options):
+    """Restituisce (DataFrame, motore usato) oppure (None, None)."""
+    file.seek(0)
     try:
         if ext in [".csv", ".tsv"]:
-            return pd.read_csv(file, sep=None, engine='python')
+            if options.get("csv_mode", "fast") == "fast":
+                return read_csv_fast(file, ext)
+            return pd.read_csv(file, sep=None, engine='python'), "python"
         elif ext in [".xlsx", ".xls"]:
-            return pd.read_excel(file)
-        elif ext == ".json":
-            return pd.read_json(file)
+            engine = excel_engine(ext)
+            df = pd.read_excel(file, sheet_name=options.get("sheet", 0),
+                               usecols=options.get("usecols") or None, engine=engine)
+            return df, f"excel ({engine})"
+        elif ext in [".json", ".jsonl", ".ndjson"]:
+            progress = st.progress(0.0, text="Lettura JSON...")
+            frames = list(iter_json_frames(file, ext, options.get("json_depth", JSON_FLATTEN_DEPTH),
+                                           on_progress=lambda f: progress.progress(f, text="Lettura JSON...")))
+            progress.empty()
+            df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+            return df, f"{JSON_ENGINE} (batch da {JSON_BATCH_ROWS:,} record)"
+        elif ext in [".parquet", ".feather"] and HAS_PYARROW:
+            return read_columnar(file, ext, options.get("columns") or None, options.get("filters") or None)
         elif ext == ".parquet":
-            return pd.read_parquet(file)
+            return pd.read_parquet(file), "parquet"
         elif ext == ".feather":
-            return pd.read_feather(file)
+            return pd.read_feather(file), "feather"
         elif ext == ".html":
-            return pd.read_html(file)[0]
+            return pd.read_html(file)[0], "html"
         elif ext == ".pdf":
-            with pdfplumber.open(file) as pdf:
-                for page in pdf.pages:
-                    table = page.extract_table()
-                    if table and len(table) > 1:
-                        return pd.DataFrame(table[1:], columns=table[0])
+            index = options.get("pdf_table", 0)
+            tables = extract_pdf_tables(file.getvalue(), max_tables=index + 1)
+            if len(tables) <= index:
+                st.warning(f"⚠️ Il PDF contiene {len(tables)} tabelle: la tabella {index + 1} non esiste")
+                return None, None
+            table = tables[index]
+            pages = table["pages"]
+            span = f"pagina {pages[0] + 1}" if len(pages) == 1 else f"pagine {pages[0] + 1}-{pages[-1] + 1}"
+            return pd.DataFrame(table["rows"], columns=table["header"]), f"pdfplumber ({span})"
     except Exception as e:
         st.error(f"Errore nel caricamento: {e}")
-    return None
+    return None, None
+
+# === ESTRAZIONE PARALLELA DELLE TABELLE PDF ===
+
+# Processi per l'estrazione (1 = nessun pool, limitato ai core) e pagine per task
+PDF_WORKERS = max(min(int(os.environ.get("PYNAPP_PDF_WORKERS", "1")), os.cpu_count() or 1), 1)
+PDF_PAGES_PER_TASK = 2
+# Sotto questo numero di pagine da estrarre non conviene avviare i processi
+PDF_PARALLEL_MIN_PAGES = 4
+# Budget della cache delle tabelle per pagina (MB)
+PDF_PAGE_CACHE_MB = 64
+
+# Tabelle già estratte, per impronta del contenuto della pagina (condivise tra file e sessioni)
+@st.cache_resource
+def get_pdf_page_cache():
+    return LRUCache(PDF_PAGE_CACHE_MB * 1024 ** 2)
+
+# Oggetto PDF nell'impronta: dizionari, liste e flussi risolti ricorsivamente
+def _hash_pdf_object(h, obj, seen):
+    if isinstance(obj, PDFObjRef):
+        if obj.objid in seen:  # Già incluso (o riferimento circolare)
+            h.update(b"<ref>")
+            return
+        seen.add(obj.objid)
+        obj = resolve1(obj)
+    if isinstance(obj, PDFStream):
+        _hash_pdf_object(h, obj.attrs, seen)
+        h.update(obj.get_data())
+    elif isinstance(obj, dict):
+        for key in sorted(obj, key=str):
+            h.update(repr(key).encode())
+            _hash_pdf_object(h, obj[key], seen)
+    elif isinstance(obj, (list, tuple)):
+        for item in obj:
+            _hash_pdf_object(h, item, seen)
+    else:
+        h.update(repr(obj).encode())
+
+# Impronta di ogni pagina: dimensioni, flussi di contenuto e risorse (font, XObject...) decodificati
+def pdf_page_hashes(pdf):
+    hashes = []
+    for page in pdf.pages:
+        h = hashlib.blake2b(repr(page.bbox).encode(), digest_size=16)
+        for stream in page.page_obj.contents or []:
+            h.update(resolve1(stream).get_data())
+        _hash_pdf_object(h, page.page_obj.resources, set())
+        hashes.append(h.hexdigest())
+    return hashes
+
+# Tabelle di una pagina come liste di righe (celle vuote come None)
+def _page_tables(page):
+    return [table for table in page.extract_tables() if table and len(table) > 1]
+
+def _tables_nbytes(tables):
+    return sum(len(cell or "") + 64 for table in tables for row in table for cell in row) + 1024
+
+# Stato dei processi worker: i byte del PDF ricevuti dall'initializer del pool
+_PDF_WORKER = {}
+
+# I worker ritrovano le funzioni dello script per nome in __main__ (com'è con streamlit run)
+def fork_pool_available(task):
+    return ("fork" in mp.get_all_start_methods()
+            and getattr(sys.modules.get("__main__"), task.__name__, None) is task)
+
+def _pdf_worker_init(data):
+    _PDF_WORKER["data"] = data
+
+def _pdf_worker_task(pages):
+    with pdfplumber.open(io.BytesIO(_PDF_WORKER["data"])) as pdf:
+        return pages, [_page_tables(pdf.pages[i]) for i in pages]
+
+# Unione delle tabelle che proseguono sulla pagina successiva ripetendo l'intestazione
+def stitch_pdf_tables(page_tables):
+    """
+    page_tables: per ogni pagina, in ordine, la lista delle sue tabelle.
+    La prima tabella di una pagina continua l'ultima della pagina precedente
+    se ha la stessa intestazione. Restituisce dict con header, rows e pages.
+    """
+    tables = []
+    for number, page in enumerate(page_tables):
+        for k, table in enumerate(page):
+            last = tables[-1] if tables else None
+            if k == 0 and last and last["pages"][-1] == number - 1 and last["header"] == table[0]:
+                last["rows"].extend(table[1:])
+                last["pages"].append(number)
+            else:
+                tables.append({"header": table[0], "rows": list(table[1:]), "pages": [number]})
+    return tables
+
+# Pagine iniziali consecutive già estratte, ed eventuale raggiungimento delle tabelle richieste
+def _pdf_prefix(results, max_tables):
+    prefix = []
+    for tables in results:
+        if tables is None:
+            break
+        prefix.append(tables)
+    # La tabella numero max_tables è completa solo quando ne inizia un'altra (o finiscono le pagine)
+    done = len(prefix) == len(results) or (
+        max_tables is not None and len(stitch_pdf_tables(prefix)) > max_tables
+    )
+    return prefix, done
 
-# Funzione di pulizia
-def clean_data(df):
-    df = df.copy()
-    df.columns = df.columns.str.strip().str.lower().str.replace(' ', '_')
-    df.dropna(how='all', inplace=True)
-    df.dropna(axis=1, how='all', inplace=True)
-    df.drop_duplicates(inplace=True)
-    for col in df.select_dtypes(include='object').columns:
+# Tabelle di tutte le pagine di un PDF, estratte in parallelo
+def extract_pdf_tables(data, max_tables=None, workers=PDF_WORKERS):
+    """
+    Le pagine già viste (stessa impronta) arrivano dalla cache; le altre sono
+    divise in blocchi da PDF_PAGES_PER_TASK ed estratte dai processi worker.
+    Con max_tables ci si ferma appena le prime max_tables tabelle sono complete.
+    """
+    cache = get_pdf_page_cache()
+    with pdfplumber.open(io.BytesIO(data)) as pdf:
+        hashes = pdf_page_hashes(pdf)
+        results = [cache.get(h) for h in hashes]
+        missing = [i for i, tables in enumerate(results) if tables is None]
+        parallel = workers > 1 and len(missing) >= PDF_PARALLEL_MIN_PAGES and fork_pool_available(_pdf_worker_task)
+        if not parallel:
+            for i in missing:
+                results[i] = _page_tables(pdf.pages[i])
+                cache.put(hashes[i], results[i], _tables_nbytes(results[i]))
+                if _pdf_prefix(results, max_tables)[1]:
+                    break
+            return stitch_pdf_tables(_pdf_prefix(results, max_tables)[0])
+
+    tasks = [missing[k:k + PDF_PAGES_PER_TASK] for k in range(0, len(missing), PDF_PAGES_PER_TASK)]
+    # I byte passano dagli argomenti dell'initializer (ereditati col fork), non da uno stato
+    # del processo server: due sessioni che estraggono insieme non si scambiano il PDF
+    executor = ProcessPoolExecutor(max_workers=min(workers, len(tasks)), mp_context=mp.get_context("fork"),
+                                   initializer=_pdf_worker_init, initargs=(data,))
+    try:
+        futures = [executor.submit(_pdf_worker_task, task) for task in tasks]
+        for future in as_completed(futures):
+            pages, page_results = future.result()
+            for i, tables in zip(pages, page_results):
+                results[i] = tables
+                cache.put(hashes[i], tables, _tables_nbytes(tables))
+            if _pdf_prefix(results, max_tables)[1]:
+                break
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+    return stitch_pdf_tables(_pdf_prefix(results, max_tables)[0])
+
+# === CARICAMENTO PIGRO DEI FILE EXCEL ===
+
+# Motore di lettura Excel: calamine (Rust) se installato, altrimenti quello standard di pandas
+def excel_engine(ext):
+    if HAS_CALAMINE:
+        return "calamine"
+    return "openpyxl" if ext == ".xlsx" else "xlrd"
+
+# Nomi dei fogli letti dai metadati della cartella di lavoro, senza leggere le celle
+def excel_sheet_names(file, ext):
+    """
+    Per .xlsx legge solo xl/workbook.xml; se manca (percorso diverso nel
+    pacchetto) o il file non è uno zip valido si passa a pd.ExcelFile.
+    """
+    file.seek(0)
+    if ext == ".xlsx":
         try:
-            df[col] = pd.to_numeric(df[col], errors='ignore')
-        except:
+            with zipfile.ZipFile(file) as zf:
+                root = ET.fromstring(zf.read("xl/workbook.xml"))
+            sheets = root.find("{*}sheets")
+            if sheets is not None:
+                return [sheet.get("name") for sheet in sheets]
+        except (KeyError, zipfile.BadZipFile, ET.ParseError):
             pass
+        file.seek(0)
+    return pd.ExcelFile(file, engine=excel_engine(ext)).sheet_names
+
+# Intestazione di un foglio (solo la prima riga), in cache per cartella di lavoro e foglio
+def excel_columns(file, ext, sheet):
+    key = ("excel-columns", file_hash(file), sheet)
+    cache = get_upload_cache()
+    columns = cache.get(key)
+    if columns is None:
+        file.seek(0)
+        header = pd.read_excel(file, sheet_name=sheet, nrows=0, engine=excel_engine(ext))
+        columns = list(header.columns)
+        cache.put(key, columns, nbytes=sum(len(str(c)) for c in columns) + 1024)
+    return columns
+
+# === LETTURA COLONNARE (Parquet / Feather) CON PROIEZIONE E FILTRI ===
+
+# Operatori ammessi nei filtri semplici sulle righe
+COLUMNAR_FILTER_OPS = ["==", "!=", "<", "<=", ">", ">="]
+
+# Schema del file (nome → tipo Arrow) letto dai soli metadati, in cache per contenuto
+def columnar_schema(file, ext):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    key = ("columnar-schema", ext, file_hash(file))
+    cache = get_upload_cache()
+    schema = cache.get(key)
+    if schema is None:
+        file.seek(0)
+        arrow_schema = pq.read_schema(file) if ext == ".parquet" else pa.ipc.open_file(file).schema
+        schema = {field.name: field.type for field in arrow_schema}
+        cache.put(key, schema, nbytes=64 * len(schema) + 1024)
+    return schema
+
+# Valore di un filtro convertito nel tipo della colonna
+def parse_filter_value(text, arrow_type):
+    import pyarrow as pa
+    text = text.strip()
+    if pa.types.is_integer(arrow_type):
+        return int(text)
+    if pa.types.is_floating(arrow_type) or pa.types.is_decimal(arrow_type):
+        return float(text)
+    if pa.types.is_boolean(arrow_type):
+        return text.lower() in ("true", "1", "si", "sì", "vero")
+    if pa.types.is_timestamp(arrow_type):
+        return pd.Timestamp(text)
+    if pa.types.is_date(arrow_type):
+        return pd.Timestamp(text).date()
+    return text
+
+# Lettura delle sole colonne richieste e dei soli row group che possono soddisfare i filtri
+def read_columnar(file, ext, columns=None, filters=None):
+    """
+    filters: lista di tuple (colonna, operatore, valore) in AND.
+    - Parquet: le statistiche dei row group scartano quelli esclusi dal
+      filtro, poi si decodificano solo le colonne richieste
+    - Feather (Arrow IPC): i buffer non compressi vengono letti senza copia
+      dai byte del file, il filtro si applica sulla tabella Arrow
+    Restituisce (DataFrame, motore usato).
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+    file.seek(0)
+    buffer = pa.py_buffer(file.read())
+    expression = pq.filters_to_expression(filters) if filters else None
+    if ext == ".parquet":
+        fragment = ds.ParquetFileFormat().make_fragment(pa.BufferReader(buffer))
+        total = fragment.num_row_groups
+        groups = fragment.split_by_row_group(expression) if expression is not None else [fragment]
+        tables = [group.to_table(columns=columns, filter=expression) for group in groups]
+        if not tables:
+            tables = [fragment.to_table(columns=columns, filter=expression)]
+        table = pa.concat_tables(tables)
+        kept = len(groups) if expression is not None else total
+        engine = f"pyarrow parquet ({kept}/{total} row group)"
+    else:
+        needed = columns
+        if columns and filters:
+            needed = list(dict.fromkeys(columns + [f[0] for f in filters]))
+        table = feather.read_table(pa.BufferReader(buffer), columns=needed)
+        if expression is not None:
+            table = table.filter(expression)
+        if columns:
+            table = table.select(columns)
+        engine = "pyarrow feather"
+    return table.to_pandas(), engine
+
+# === LETTORE JSON / NDJSON A BATCH ===
+
+# Record per batch e livelli di oggetti annidati espansi in colonne (default)
+JSON_BATCH_ROWS = 50_000
+JSON_FLATTEN_DEPTH = 2
+
+# Parser JSON veloce se disponibile
+if HAS_ORJSON:
+    import orjson
+    _json_loads, _json_dumps, JSON_ENGINE = orjson.loads, lambda v: orjson.dumps(v).decode(), "orjson"
+else:
+    _json_loads, _json_dumps, JSON_ENGINE = json.loads, json.dumps, "json"
+
+# Record annidato → dizionario piatto con chiavi "padre.figlio"
+def flatten_record(record, depth, prefix="", out=None):
+    """
+    Gli oggetti vengono espansi per al più depth livelli; oltre quel livello,
+    e per le liste, il valore resta come testo JSON (così resta confrontabile).
+    """
+    out = {} if out is None else out
+    if not isinstance(record, dict):
+        out[prefix.rstrip(".") or "valore"] = record
+        return out
+    for key, value in record.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict) and depth > 0:
+            flatten_record(value, depth - 1, name + ".", out)
+        elif isinstance(value, (dict, list)):
+            out[name] = _json_dumps(value)
+        else:
+            out[name] = value
+    return out
+
+# Batch di record → DataFrame: pandas passa dai dizionari piatti direttamente
+# a colonne tipizzate (int64/float64/bool/object), le chiavi assenti diventano NaN
+def records_to_frame(records, depth=JSON_FLATTEN_DEPTH):
+    return pd.DataFrame.from_records([flatten_record(record, depth) for record in records])
+
+# Record di un documento JSON: una lista, oppure la prima lista di oggetti in un dizionario (es. {"data": [...]})
+def _document_records(document):
+    if isinstance(document, list):
+        return document
+    if isinstance(document, dict):
+        for value in document.values():
+            if isinstance(value, list) and value and isinstance(value[0], dict):
+                return value
+    return [document]
+
+# Orientamento pandas di un documento che non è una lista di record (None = record unico)
+def _document_orient(document):
+    """
+    Riconosce le tabelle scritte da DataFrame.to_json: "split" ({columns,
+    data, index}), "columns" (dizionario di liste o di dizionari per
+    colonna), "index" (dizionario di righe con etichette numeriche) e
+    "values" (lista di liste).
+    """
+    if isinstance(document, list):
+        return "values" if document and all(isinstance(v, list) for v in document) else None
+    if not isinstance(document, dict) or not document:
+        return None
+    values = list(document.values())
+    if any(isinstance(v, list) and v and isinstance(v[0], dict) for v in values):
+        return None
+    if {"columns", "data"} <= document.keys() and isinstance(document["data"], list):
+        return "split"
+    if all(isinstance(v, list) for v in values):
+        return "columns"
+    if all(isinstance(v, dict) for v in values):
+        inner = set().union(*values)
+        numeric = lambda keys: all(str(k).lstrip("-").isdigit() for k in keys)
+        return "index" if numeric(document) and not numeric(inner) else "columns"
+    return None
+
+# Lettura a batch di JSON/NDJSON con progresso
+def iter_json_frames(file, ext, depth=JSON_FLATTEN_DEPTH, batch_rows=JSON_BATCH_ROWS, on_progress=None):
+    """
+    - NDJSON (o .json con un record per riga): letto riga per riga, in memoria
+      resta un solo batch di record grezzi alla volta
+    - documento JSON: analizzato per intero, poi convertito a batch; le
+      tabelle in un altro orientamento pandas (_document_orient) passano
+      da pd.read_json in un solo blocco
+    on_progress riceve la frazione letta (0..1).
+    """
+    file.seek(0, os.SEEK_END)
+    total = max(file.tell(), 1)
+    file.seek(0)
+    if ext == ".json":
+        raw = file.read()
         try:
-            df[col] = pd.to_datetime(df[col], errors='ignore')
-        except:
-            pass
+            document = _json_loads(raw)
+        except ValueError:
+            # Più documenti uno per riga: si passa alla lettura per righe
+            records = None
+        else:
+            records = _document_records(document)
+            orient = _document_orient(document)
+            if orient is not None:
+                try:
+                    frame = pd.read_json(io.BytesIO(raw) if isinstance(raw, bytes) else io.StringIO(raw), orient=orient)
+                except ValueError:  # Es. liste di lunghezze diverse: resta un record unico
+                    frame = None
+                if frame is not None:
+                    yield frame
+                    if on_progress:
+                        on_progress(1.0)
+                    return
+        if records is not None:
+            for start in range(0, len(records), batch_rows):
+                yield records_to_frame(records[start:start + batch_rows], depth)
+                if on_progress:
+                    on_progress(min((start + batch_rows) / max(len(records), 1), 1.0))
+            return
+        file.seek(0)
+    batch = []
+    for line in file:
+        if line.strip():
+            batch.append(_json_loads(line))
+        if len(batch) >= batch_rows:
+            yield records_to_frame(batch, depth)
+            batch = []
+            if on_progress:
+                on_progress(file.tell() / total)
+    if batch:
+        yield records_to_frame(batch, depth)
+    if on_progress:
+        on_progress(1.0)
+
+# Nomi di colonna normalizzati (minuscolo, senza spazi)
+def _normalize_columns(df):
+    df.columns = df.columns.astype(str).str.strip().str.lower().str.replace(' ', '_')
     return df
 
+# Righe (non nulle) campionate per decidere il tipo di una colonna di testo
+TYPE_SAMPLE_ROWS = 1_000
+
+_NUMERIC_RE = re.compile(r"^\s*[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?\s*$")
+_DATE_LIKE_RE = re.compile(r"^\s*\d{1,4}[-/.]\d{1,2}[-/.]\d{1,4}")
+
+# Formati data/ora provati in ordine sul campione (ISO8601 come ultima risorsa)
+DATETIME_FORMATS = [
+    "%Y-%m-%d", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M",
+    "%d/%m/%Y", "%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M", "%m/%d/%Y",
+    "%d-%m-%Y", "%d.%m.%Y", "%Y/%m/%d", "ISO8601",
+]
+
+# Formato data trovato per ciascuna "forma" di valore (cifre → 9), condiviso tra le sessioni
+@st.cache_resource
+def get_datetime_format_cache():
+    return {}
+
+def _value_shape(value):
+    return re.sub(r"\d", "9", value.strip())
+
+# Formato data comune a tutti i valori del campione, oppure None
+def detect_datetime_format(sample):
+    if not sample.str.match(_DATE_LIKE_RE).all():
+        return None
+    cache = get_datetime_format_cache()
+    shape = _value_shape(sample.iloc[0])
+    cached = cache.get(shape)
+    candidates = [cached] + DATETIME_FORMATS if cached else DATETIME_FORMATS
+    for fmt in candidates:
+        parsed = pd.to_datetime(sample, format=fmt, errors='coerce')
+        if parsed.notna().all():
+            cache[shape] = fmt
+            return fmt
+    return None
+
+# Tipo di una colonna di testo dedotto da un campione: ("numeric"|"datetime"|"text", formato)
+def infer_column_type(series, sample_rows=TYPE_SAMPLE_ROWS):
+    step = max(len(series) // sample_rows, 1)
+    sample = series.iloc[::step].dropna()
+    if sample.empty:
+        sample = series.dropna().head(sample_rows)
+    if sample.empty:
+        return "text", None
+    sample = sample.astype(str)
+    if sample.str.match(_NUMERIC_RE).all():
+        return "numeric", None
+    fmt = detect_datetime_format(sample)
+    if fmt is not None:
+        return "datetime", fmt
+    return "text", None
+
+# Schema dedotto per le colonne di testo e conversione delle sole colonne idonee
+def infer_schema(df):
+    start = time.perf_counter()
+    rows = []
+    for col in df.select_dtypes(include=['object', 'string']).columns:
+        kind, fmt = infer_column_type(df[col])
+        converted = None
+        if kind == "numeric":
+            converted = pd.to_numeric(df[col], errors='coerce')
+        elif kind == "datetime":
+            converted = pd.to_datetime(df[col], format=fmt, errors='coerce')
+        # Il campione può sbagliare: se la conversione perde valori la colonna resta testo
+        applied = converted is not None and converted.isna().sum() == df[col].isna().sum()
+        if applied:
+            df[col] = converted
+        rows.append({
+            "Colonna": col,
+            "Tipo dedotto": kind,
+            "Formato": fmt or "",
+            "Convertita": applied,
+            "Dtype finale": str(df[col].dtype),
+        })
+    schema = pd.DataFrame(rows, columns=["Colonna", "Tipo dedotto", "Formato", "Convertita", "Dtype finale"])
+    return schema, time.perf_counter() - start
+
+# Rapporto massimo valori distinti / righe per convertire una colonna di testo in categoria
+CATEGORY_MAX_RATIO = 0.5
+
+# Tipo intero più piccolo (con o senza segno) che contiene [lo, hi], solo se più stretto di itemsize byte
+def _smallest_int_dtype(lo, hi, itemsize=8):
+    candidates = [(np.int8, np.uint8), (np.int16, np.uint16), (np.int32, np.uint32)]
+    for signed, unsigned in candidates:
+        if np.dtype(signed).itemsize >= itemsize:
+            break
+        # A parità di dimensione si preferisce il tipo con segno, poi quello senza se lo >= 0
+        for dtype in (signed, unsigned) if lo >= 0 else (signed,):
+            info = np.iinfo(dtype)
+            if info.min <= lo and hi <= info.max:
+                return dtype
+    return None
+
+# Versione compatta di una colonna, oppure None se non c'è nulla da guadagnare
+def compact_column(series):
+    if pd.api.types.is_bool_dtype(series):
+        return None
+    if pd.api.types.is_integer_dtype(series) and isinstance(series.dtype, np.dtype):
+        if series.empty:
+            return None
+        dtype = _smallest_int_dtype(int(series.min()), int(series.max()), series.dtype.itemsize)
+        return series.astype(dtype) if dtype is not None else None
+    if pd.api.types.is_float_dtype(series) and series.dtype == np.float64:
+        # float32 solo se ogni valore torna identico: le statistiche non cambiano
+        values = series.to_numpy()
+        narrow = values.astype(np.float32)
+        if np.array_equal(narrow.astype(np.float64), values, equal_nan=True):
+            return series.astype(np.float32)
+        return None
+    if series.dtype == object and pd.api.types.infer_dtype(series, skipna=True) == "string":
+        if series.nunique(dropna=True) <= CATEGORY_MAX_RATIO * len(series):
+            return series.astype("category")
+        if HAS_PYARROW:
+            return series.astype("string[pyarrow]")
+    return None
+
+# Riduzione della memoria: downcast numerico senza perdite, categorie e stringhe pyarrow
+def compact_frame(df):
+    # Copia superficiale: le colonne compattate sostituiscono le originali senza copiare le altre
+    df = df.copy(deep=False)
+    rows = []
+    for col in df.columns:
+        before = int(df[col].memory_usage(index=False, deep=True))
+        new = compact_column(df[col])
+        after = int(new.memory_usage(index=False, deep=True)) if new is not None else before
+        rows.append({
+            "Colonna": col,
+            "Dtype prima": str(df[col].dtype),
+            "Dtype dopo": str(new.dtype) if new is not None else str(df[col].dtype),
+            "MB prima": before / 2**20,
+            "MB dopo": after / 2**20,
+        })
+        if new is not None:
+            df[col] = new
+    report = pd.DataFrame(rows, columns=["Colonna", "Dtype prima", "Dtype dopo", "MB prima", "MB dopo"])
+    return df, report
+
+# === DEDUPLICAZIONE PER IMPRONTA ===
+
+# Budget della cache delle impronte di riga (MB)
+DIGEST_CACHE_MB = 128
+
+# Chiavi di hash indipendenti: una per ogni metà dell'impronta a 128 bit
+_DIGEST_KEYS = ("0123456789123456", "pynapp-dedup-128")
+
+# Impronte delle righe: hash vettoriale colonna per colonna, combinato in 64 o 128 bit
+def row_digests(df, subset=None, bits=64):
+    """
+    Restituisce un array uint64 (n,) per 64 bit oppure (n, 2) per 128 bit.
+    Con 64 bit la probabilità di una collisione è ~n²/2⁶⁵, trascurabile
+    fino a centinaia di milioni di righe; 128 bit la rende nulla in pratica.
+    """
+    frame = df if subset is None else df[list(subset)]
+    digests = [pd.util.hash_pandas_object(frame, index=False, hash_key=key).to_numpy()
+               for key in _DIGEST_KEYS[:bits // 64]]
+    return digests[0] if bits == 64 else np.column_stack(digests)
+
+# Cache condivisa delle impronte: cambiare keep o gli altri filtri non richiede un nuovo hash
+@st.cache_resource
+def get_digest_cache():
+    return LRUCache(DIGEST_CACHE_MB * 1024 ** 2)
+
+# Impronte in cache sotto la provenienza del dataframe (hash del file e passi già applicati)
+def cached_row_digests(df, subset=None, bits=64, lineage=None):
+    if lineage is None:
+        return row_digests(df, subset, bits)
+    key = (lineage, tuple(subset) if subset else None, bits)
+    cache = get_digest_cache()
+    digests = cache.get(key)
+    if digests is None:
+        digests = row_digests(df, subset, bits)
+        cache.put(key, digests)
+    return digests
+
+# Maschera delle righe da tenere (keep: "first", "last" o False), limitata alle righe ancora attive
+def unique_rows_mask(digests, keep="first", rows=None):
+    positions = np.arange(len(digests)) if rows is None else np.flatnonzero(rows)
+    active = digests[positions]
+    if active.ndim == 1:
+        duplicated = pd.Series(active, copy=False).duplicated(keep=keep).to_numpy()
+    else:
+        duplicated = pd.DataFrame(active, copy=False).duplicated(keep=keep).to_numpy()
+    mask = np.zeros(len(digests), dtype=bool)
+    mask[positions[~duplicated]] = True
+    return mask
+
+# === PIPELINE DI PULIZIA ===
+
+# Opzioni di pulizia di default
+CLEANING_DEFAULTS = {
+    "remove_dups": True, "dup_subset": [], "dup_keep": "first", "dup_bits": 64,
+    "missing_opt": "Mantieni", "compact": False,
+}
+
+# Filtri: ricevono il dataframe completo, le righe e colonne ancora tenute e le opzioni,
+# restituiscono (maschera righe, maschera colonne) oppure None dove non filtrano
+def _filter_empty(df, rows, cols, options):
+    present = df.notna().to_numpy()
+    return present.any(axis=1), present.any(axis=0)
+
+def _filter_missing(df, rows, cols, options):
+    return df.notna().to_numpy()[:, cols].all(axis=1), None
+
+def _filter_duplicates(df, rows, cols, options):
+    subset = [c for c in options["dup_subset"] if c in df.columns] or None
+    digests = cached_row_digests(df, subset, options["dup_bits"], options["lineage"])
+    return unique_rows_mask(digests, options["dup_keep"], rows), None
+
+# Trasformazioni: ricevono il dataframe, se è già una copia propria e il report,
+# restituiscono il dataframe (None se il passo non aveva nulla da fare)
+def _step_normalize_names(df, owned, report):
+    return _normalize_columns(df)
+
+def _step_fill_zero(df, owned, report):
+    if not df.isna().to_numpy().any():
+        return None
+    if owned:
+        df.fillna(0, inplace=True)
+        return df
+    return df.fillna(0)
+
+def _step_infer_types(df, owned, report):
+    report["schema"], report["seconds"] = infer_schema(df)
+    return df
+
+def _step_compact(df, owned, report):
+    df, report["compact"] = compact_frame(df)
+    return df
+
+# Passi in ordine: (nome, tipo, attivo in base alle opzioni, funzione)
+CLEANING_STEPS = [
+    ("Normalizza nomi colonna", "transform", lambda o: True, _step_normalize_names),
+    ("Rimuovi righe e colonne vuote", "filter", lambda o: True, _filter_empty),
+    ("Rimuovi righe con valori mancanti", "filter", lambda o: o["missing_opt"] == "Rimuovi", _filter_missing),
+    ("Riempi i mancanti con 0", "transform", lambda o: o["missing_opt"] == "Riempi con 0", _step_fill_zero),
+    ("Rimuovi duplicati", "filter", lambda o: o["remove_dups"], _filter_duplicates),
+    ("Deduci i tipi", "transform", lambda o: True, _step_infer_types),
+    ("Compatta in memoria", "transform", lambda o: o["compact"], _step_compact),
+]
+
+# Memoria temporanea (byte) che un passo alloca oltre alla copia di lavoro: maschere n×p, impronte di riga
+CLEANING_SCRATCH = {
+    _filter_empty: lambda df, o: df.size,
+    _filter_missing: lambda df, o: df.size,
+    _step_fill_zero: lambda df, o: df.size,
+    _filter_duplicates: lambda df, o: len(df) * 8 * (o["dup_bits"] // 64 + 1),
+}
+
+# Byte di un dataframe con il contenuto delle celle object stimato su un campione a passo fisso
+def _frame_nbytes(df, sample_rows=TYPE_SAMPLE_ROWS):
+    total = int(df.memory_usage(index=True, deep=False).sum())
+    for j in np.flatnonzero((df.dtypes == object).to_numpy()):
+        values = df.iloc[:, j].to_numpy()
+        if len(values):
+            step = max(len(values) // sample_rows, 1)
+            total += int(np.mean([sys.getsizeof(v) for v in values[::step]]) * len(values))
+    return total
+
+# Byte dei buffer della copia di lavoro non condivisi con il dataframe in ingresso
+def _working_nbytes(df, owned, input_dtypes):
+    usage = df.memory_usage(index=owned, deep=False)
+    if owned:
+        return int(usage.sum())
+    # Copia superficiale: nuove solo le colonne convertite (stesse posizioni dell'ingresso)
+    changed = [str(a) != str(b) for a, b in zip(df.dtypes, input_dtypes)]
+    return int(usage.to_numpy()[changed].sum())
+
+# Funzione di pulizia: esegue CLEANING_STEPS senza copie intermedie
+def clean_data(df, options=None, source=None):
+    """
+    I filtri si accumulano in un'unica maschera di righe e colonne, applicata
+    con una sola copia prima della trasformazione successiva; le trasformazioni
+    lavorano in place sulla copia. I passi disattivati o senza effetto vengono
+    saltati. Con source (identità del dataframe in ingresso, es. hash del file)
+    ogni passo riceve in options["lineage"] source più i passi attivi prima
+    di lui, chiave sicura per le cache condivise tra sessioni.
+    Il picco di memoria stimato somma il dataframe in ingresso (con le
+    stringhe), la copia di lavoro (buffer non condivisi con l'ingresso) e
+    le allocazioni temporanee del passo più pesante (CLEANING_SCRATCH).
+    Restituisce (DataFrame pulito, report con passi, schema e memoria).
+    """
+    options = {**CLEANING_DEFAULTS, **(options or {})}
+    report = {"schema": None, "seconds": 0.0, "compact": None}
+    steps = []
+    input_nbytes = _frame_nbytes(df)
+    input_dtypes = list(df.dtypes)
+    peak = 0
+
+    # Copia superficiale: il dataframe in cache non viene mai modificato
+    df = df.copy(deep=False)
+    owned = False
+    rows = np.ones(len(df), dtype=bool)
+    cols = np.ones(df.shape[1], dtype=bool)
+
+    def materialize():
+        nonlocal df, owned, rows, cols
+        if rows.all() and cols.all():
+            return
+        df = df.iloc[np.flatnonzero(rows), np.flatnonzero(cols)]
+        owned = True
+        rows = np.ones(len(df), dtype=bool)
+        cols = np.ones(df.shape[1], dtype=bool)
+
+    active = []
+    for name, kind, enabled, step in CLEANING_STEPS:
+        start = time.perf_counter()
+        removed = 0
+        options["lineage"] = None if source is None else (source, tuple(active))
+        working = _working_nbytes(df, owned, input_dtypes)
+        scratch = CLEANING_SCRATCH[step](df, options) if step in CLEANING_SCRATCH and enabled(options) else 0
+        peak = max(peak, working + scratch + rows.nbytes + cols.nbytes)
+        if not enabled(options):
+            status = "disattivato"
+        elif kind == "filter":
+            kept_rows, kept_cols = int(rows.sum()), int(cols.sum())
+            row_mask, col_mask = step(df, rows, cols, options)
+            if row_mask is not None:
+                rows &= row_mask
+            if col_mask is not None:
+                cols &= col_mask
+            removed = kept_rows - int(rows.sum())
+            changed = removed > 0 or int(cols.sum()) != kept_cols
+            status = "eseguito" if changed else "nessuna modifica"
+        else:
+            materialize()
+            result = step(df, owned, report)
+            if result is None:
+                status = "nessuna modifica"
+            else:
+                owned = owned or result is not df
+                df = result
+                status = "eseguito"
+        steps.append({
+            "Passo": name,
+            "Stato": status,
+            "Righe": int(rows.sum()),
+            "Rimosse": removed,
+            "Colonne": int(cols.sum()),
+            "ms": (time.perf_counter() - start) * 1000,
+        })
+        if status != "disattivato":
+            active.append(name)
+    materialize()
+
+    peak = max(peak, _working_nbytes(df, owned, input_dtypes))
+    report["input_mb"] = input_nbytes / 2**20
+    report["peak_mb"] = (input_nbytes + peak) / 2**20
+    report["steps"] = pd.DataFrame(steps, columns=["Passo", "Stato", "Righe", "Rimosse", "Colonne", "ms"])
+    return df, report
+
+# Colonne della tabella di statistiche per colonna numerica
+STATS_COLUMNS = ['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max', 'skew', 'kurt', 'missing', 'n_rows', 'outliers']
+
+# Motore statistico unico per tutte le colonne numeriche
+def numeric_stats_table(df, sketches=None):
+    """
+    Una riga per colonna numerica con le colonne di STATS_COLUMNS.
+    Tutte le colonne sono copiate una sola volta in un blocco 2-D contiguo
+    (una colonna per segmento di memoria): momenti, quantili, minimo/massimo
+    e outlier IQR escono da operazioni vettoriali su quel blocco.
+    Con gli sketch KLL (modalità approssimata) i quartili vengono dagli
+    sketch e il blocco non viene ordinato.
+    È il formato comune all'analisi in memoria e a quella in streaming:
+    le regole (Malizia, Fischer, IQR) lavorano solo su questa tabella.
+    """
+    num = df.select_dtypes(include=np.number)
+    block = np.asfortranarray(num.to_numpy(dtype=float, na_value=np.nan))
+    n_rows, p = block.shape
+    if p == 0:
+        return pd.DataFrame(columns=STATS_COLUMNS, dtype=float)
+
+    moments = block_moments(block)
+    mean, std, skew, kurt = moments_to_stats(moments)
+    count = moments[0].astype(np.int64)
+    has_data = count > 0
+
+    if sketches is not None:
+        q1, q2, q3 = sketch_quartiles(sketches, num.columns)
+        with np.errstate(invalid='ignore'):
+            lo_val = np.where(has_data, np.fmin.reduce(block, axis=0), np.nan)
+            hi_val = np.where(has_data, np.fmax.reduce(block, axis=0), np.nan)
+            iqr = q3 - q1
+            outliers = ((block < q1 - 1.5 * iqr) | (block > q3 + 1.5 * iqr)).sum(axis=0).astype(float)
+        return _stats_frame(num.columns, count, mean, std, lo_val, q1, q2, q3, hi_val, skew, kurt, n_rows, outliers)
+
+    # Un solo ordinamento per colonna: i NaN finiscono in coda
+    ordered = np.sort(block, axis=0)
+    q1, q2, q3 = (_sorted_quantile(ordered, count, q) for q in (0.25, 0.5, 0.75))
+    cols = np.arange(p)
+    lo_val = np.where(has_data, ordered[0], np.nan)
+    hi_val = np.where(has_data, ordered[np.maximum(count - 1, 0), cols], np.nan)
+
+    # Outlier IQR contati sul blocco ordinato con una ricerca binaria per colonna
+    iqr = q3 - q1
+    lower, upper = q1 - 1.5 * iqr, q3 + 1.5 * iqr
+    outliers = np.array([
+        np.searchsorted(ordered[:count[j], j], lower[j], side='left')
+        + count[j] - np.searchsorted(ordered[:count[j], j], upper[j], side='right')
+        if count[j] else 0
+        for j in cols
+    ], dtype=float)
+
+    return _stats_frame(num.columns, count, mean, std, lo_val, q1, q2, q3, hi_val, skew, kurt, n_rows, outliers)
+
+def _stats_frame(columns, count, mean, std, lo_val, q1, q2, q3, hi_val, skew, kurt, n_rows, outliers):
+    return pd.DataFrame({
+        'count': count, 'mean': mean, 'std': std, 'min': lo_val,
+        '25%': q1, '50%': q2, '75%': q3, 'max': hi_val,
+        'skew': skew, 'kurt': kurt, 'missing': n_rows - count,
+        'n_rows': n_rows, 'outliers': outliers
+    }, index=columns, columns=STATS_COLUMNS).astype(float)
+
+# Quantile con interpolazione lineare (come pandas) su colonne già ordinate
+def _sorted_quantile(ordered, count, q):
+    pos = np.maximum(count - 1, 0) * q
+    lo = np.floor(pos).astype(np.int64)
+    hi = np.ceil(pos).astype(np.int64)
+    cols = np.arange(ordered.shape[1])
+    lo_val, hi_val = ordered[lo, cols], ordered[hi, cols]
+    return np.where(count > 0, lo_val + (hi_val - lo_val) * (pos - lo), np.nan)
+
+# === SKETCH DEI QUANTILI (KLL) ===
+
+# Dimensione di default dello sketch: errore di rango ≈ 2 / k
+KLL_K = 200
+
+# Sketch KLL per i quantili approssimati, unibile tra blocchi di dati
+class KLLSketch:
+    """
+    Sketch KLL (Karnin-Lang-Liberty):
+    - una pila di compattatori; un elemento al livello h pesa 2^h
+    - quando un livello supera la capienza viene ordinato e metà dei suoi
+      elementi (pari o dispari, a caso) sale al livello successivo
+    - le capienze decrescono di 2/3 scendendo dai livelli alti ai bassi
+    Memoria O(k log(n/k)); l'errore di rango normalizzato resta sotto
+    circa 2 / k con alta probabilità, qualunque sia n.
+    """
+    def __init__(self, k=KLL_K, seed=None):
+        self.k = k
+        self.n = 0
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    @property
+    def rank_error(self):
+        return 2.0 / self.k
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(int(np.ceil(self.k * (2 / 3) ** depth)), 2)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return self
+        self.n += len(values)
+        level = 0
+        if len(values) > self.k:
+            # Blocco grande: una sola compattazione equivalente, un elemento ogni 2^h
+            level = int(np.ceil(np.log2(len(values) / self.k)))
+            step = 2 ** level
+            values = np.sort(values)[self._rng.integers(step)::step]
+        while len(self.levels) <= level:
+            self.levels.append(np.empty(0))
+        self.levels[level] = np.concatenate((self.levels[level], values))
+        self._compress()
+        return self
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) <= self._capacity(level):
+                level += 1
+                continue
+            if level + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+            items = np.sort(items)
+            even = len(items) - len(items) % 2  # Un elemento dispari resta dov'è
+            promoted = items[self._rng.integers(2):even:2]
+            self.levels[level] = items[even:]
+            self.levels[level + 1] = np.concatenate((self.levels[level + 1], promoted))
+            level = 0  # Le capienze cambiano quando cresce la pila
+
+    def quantiles(self, qs):
+        """Valori ai quantili qs (elementi dello sketch, senza interpolazione)."""
+        if self.n == 0:
+            return np.full(len(qs), np.nan)
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(lvl), 2.0 ** h) for h, lvl in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        cumulative = np.cumsum(weights[order])
+        idx = np.searchsorted(cumulative, np.asarray(qs) * cumulative[-1], side='left')
+        return items[order][np.minimum(idx, len(items) - 1)]
+
+    @property
+    def nbytes(self):
+        return sum(lvl.nbytes for lvl in self.levels)
+
+# Uno sketch per colonna numerica, costruito in una sola passata a blocchi di righe
+def build_column_sketches(df, k=KLL_K, chunk_rows=None):
+    chunk_rows = chunk_rows or STREAM_CHUNK_ROWS
+    num = df.select_dtypes(include=np.number)
+    sketches = {col: KLLSketch(k, seed=j) for j, col in enumerate(num.columns)}
+    for start in range(0, len(num), chunk_rows):
+        block = num.iloc[start:start + chunk_rows].to_numpy(dtype=float, na_value=np.nan)
+        for j, col in enumerate(num.columns):
+            sketches[col].update(block[:, j])
+    return sketches
+
+# Quartili (Q1, mediana, Q3) di ogni colonna letti dagli sketch
+def sketch_quartiles(sketches, columns):
+    values = np.array([sketches[col].quantiles([0.25, 0.5, 0.75]) for col in columns]).reshape(-1, 3)
+    return values[:, 0], values[:, 1], values[:, 2]
+
+# === CONTEGGI DISTINTI APPROSSIMATI (HyperLogLog) ===
+
+# Errore relativo di default, righe sotto cui si conta in modo esatto, budget della cache (MB)
+HLL_ERROR = 0.01
+HLL_EXACT_ROWS = int(os.environ.get("PYNAPP_HLL_EXACT_ROWS", "200000"))
+HLL_CACHE_MB = 64
+
+# Sketch HyperLogLog per il numero di valori distinti, unibile tra blocchi di dati
+class HyperLogLog:
+    """
+    2^p registri da un byte: i primi p bit dell'hash a 64 bit scelgono il
+    registro, che ricorda la posizione massima del primo bit a 1 nei bit
+    restanti. Errore relativo standard ≈ 1.04 / sqrt(2^p), memoria 2^p byte
+    qualunque sia il numero di righe. Due sketch con la stessa precisione
+    si uniscono con il massimo registro per registro.
+    """
+    def __init__(self, p=14):
+        self.p = min(max(p, 11), 18)
+        self.registers = np.zeros(1 << self.p, dtype=np.uint8)
+
+    @classmethod
+    def for_error(cls, error=HLL_ERROR):
+        return cls(int(np.clip(np.ceil(np.log2((1.04 / error) ** 2)), 11, 18)))
+
+    @property
+    def error(self):
+        return 1.04 / np.sqrt(len(self.registers))
+
+    def update_hashes(self, hashes):
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        if not len(hashes):
+            return
+        tail_bits = 64 - self.p
+        index = (hashes >> np.uint64(tail_bits)).astype(np.int64)
+        rest = hashes & np.uint64((1 << tail_bits) - 1)
+        # Lunghezza in bit di rest dall'esponente: esatta perché rest < 2^53 (p ≥ 11)
+        _, length = np.frexp(rest.astype(np.float64))
+        np.maximum.at(self.registers, index, (tail_bits - length + 1).astype(np.uint8))
+
+    def update(self, series):
+        # Hash valore per valore, senza fattorizzare: memoria proporzionale al blocco, non ai distinti
+        present = series.notna().to_numpy()
+        try:
+            hashes = pd.util.hash_array(series.to_numpy(), categorize=False)
+        except (TypeError, ValueError):  # Celle non hashabili (liste, dizionari)
+            hashes = pd.util.hash_array(series.astype(str).to_numpy(dtype=object), categorize=False)
+        self.update_hashes(hashes[present])
+
+    def merge(self, other):
+        if other.p != self.p:
+            raise ValueError("Sketch HyperLogLog con precisioni diverse")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:  # Pochi valori: conteggio lineare dei registri vuoti
+            return m * np.log(m / zeros)
+        return float(raw)
+
+    @property
+    def nbytes(self):
+        return self.registers.nbytes
+
+# Uno sketch per colonna, costruito a blocchi di righe e unito blocco dopo blocco
+def build_distinct_sketches(df, error=HLL_ERROR, chunk_rows=None):
+    chunk_rows = chunk_rows or STREAM_CHUNK_ROWS
+    sketches = {col: HyperLogLog.for_error(error) for col in df.columns}
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows]
+        for j, col in enumerate(df.columns):
+            part = HyperLogLog.for_error(error)
+            part.update(chunk.iloc[:, j])
+            sketches[col].merge(part)
+    return sketches
+
+# Cache condivisa degli sketch: stesso dataset ed errore, nessuna nuova passata
+@st.cache_resource
+def get_distinct_cache():
+    return LRUCache(HLL_CACHE_MB * 1024 ** 2)
+
+# Valori distinti per colonna: esatti sui dataset piccoli (o senza errore), altrimenti da HyperLogLog
+def distinct_counts(df, error=None, source=None):
+    """
+    Restituisce (Series con i conteggi, esatti sì/no). Con source (versione
+    del dataset pulito, es. AnalysisGraph.version("clean")) gli sketch
+    restano in cache per source ed errore richiesto.
+    """
+    if error is None or len(df) <= HLL_EXACT_ROWS:
+        columns = df.columns
+    else:  # Le categorie hanno già i loro codici: il conteggio esatto costa poco
+        columns = df.select_dtypes(include='category').columns
+    counts = {}
+    for col in columns:
+        try:
+            counts[col] = df[col].nunique()
+        except TypeError:  # Celle non hashabili (liste, dizionari)
+            counts[col] = df[col].astype(str).nunique()
+    if len(columns) == len(df.columns):
+        return pd.Series(counts, index=df.columns, dtype=float), True
+    cache = get_distinct_cache()
+    sketches = cache.get((source, error)) if source is not None else None
+    if sketches is None:
+        sketches = build_distinct_sketches(df.drop(columns=columns), error)
+        if source is not None:
+            cache.put((source, error), sketches, nbytes=sum(sk.nbytes for sk in sketches.values()))
+    for col, sketch in sketches.items():
+        counts[col] = min(round(sketch.estimate()), int(df[col].count()))
+    return pd.Series(counts, index=df.columns, dtype=float), False
+
+# === PROFILO DELLE COLONNE ===
+
+# Valori più frequenti per colonna e righe del campione su cui stimarli per i dataset grandi
+PROFILE_TOP_K = 3
+PROFILE_SAMPLE_ROWS = 100_000
+
+PROFILE_COLUMNS = ['dtype', 'kind', 'nulls', 'distinct', 'min', 'max', 'top', 'sample']
+
+# Famiglia di una colonna per le sezioni che scelgono colonne per tipo
+def _column_kinds(df):
+    kinds = pd.Series("altro", index=pd.RangeIndex(df.shape[1]), dtype=object)
+    for kind, include in [("numeric", [np.number]), ("text", ['object', 'category', 'string']),
+                          ("datetime", ['datetime64', 'datetimetz']), ("bool", ['bool'])]:
+        kinds[df.columns.get_indexer_for(df.select_dtypes(include=include).columns)] = kind
+    return kinds.to_numpy()
+
+# Codici dei valori di una colonna (NaN = -1) e valori distinti nell'ordine in cui compaiono
+def _factorize(series):
+    try:
+        return pd.factorize(series, sort=False)
+    except TypeError:  # Celle non hashabili (liste, dizionari)
+        return pd.factorize(series.astype(str).where(series.notna()), sort=False)
+
+# Profilo di tutte le colonne, condiviso da riepilogo, Smart Advisor e generatore di template
+def column_profile(df, error=None, top_k=PROFILE_TOP_K, source=None):
+    """
+    Una riga per colonna con PROFILE_COLUMNS: tipo, famiglia, nulli,
+    valori distinti, minimo e massimo (colonne ordinabili), valori più
+    frequenti [(valore, conteggio)] e il primo valore non nullo.
+    Una sola fattorizzazione per colonna dà nulli, distinti, frequenze ed
+    esempio; minimi e massimi sono riduzioni sui gruppi di colonne dello
+    stesso dtype (i blocchi del DataFrame). Con error, oltre HLL_EXACT_ROWS
+    righe, i distinti vengono da distinct_counts e le frequenze da un
+    campione di righe (conteggi riscalati); source è la chiave di cache
+    degli sketch (vedi distinct_counts).
+    Restituisce (profilo, distinti esatti sì/no).
+    """
+    n_cols = df.shape[1]
+    kinds = _column_kinds(df)
+    approximate = error is not None and len(df) > HLL_EXACT_ROWS
+    nulls, distinct = np.zeros(n_cols, dtype=np.int64), np.zeros(n_cols)
+    lo, hi, top, sample = (np.full(n_cols, None, dtype=object) for _ in range(4))
+
+    positions_by_dtype = {}
+    for j, dtype in enumerate(df.dtypes):
+        positions_by_dtype.setdefault(str(dtype), []).append(j)
+    for positions in positions_by_dtype.values():
+        group = df.iloc[:, positions]
+        if kinds[positions[0]] in ("numeric", "datetime", "bool") and len(group):
+            lo[positions], hi[positions] = group.min().tolist(), group.max().tolist()
+        if approximate:
+            nulls[positions] = group.isna().sum().to_numpy()
+
+    if approximate:
+        distinct, exact = distinct_counts(df, error, source)
+        distinct = distinct.to_numpy()
+        step = max(len(df) // PROFILE_SAMPLE_ROWS, 1)
+        rows = df.iloc[::step]
+    else:
+        exact, step, rows = True, 1, df
+    for j in range(n_cols):
+        codes, uniques = _factorize(rows.iloc[:, j])
+        counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+        if not approximate:
+            nulls[j], distinct[j] = len(codes) - counts.sum(), len(uniques)
+        frequent = np.argpartition(-counts, top_k)[:top_k] if len(counts) > top_k else np.arange(len(counts))
+        frequent = frequent[np.lexsort((frequent, -counts[frequent]))]
+        top[j] = [(uniques[i], int(counts[i]) * step) for i in frequent]
+        sample[j] = uniques[0] if len(uniques) else None
+
+    profile = pd.DataFrame({
+        'dtype': [str(t) for t in df.dtypes], 'kind': kinds, 'nulls': nulls, 'distinct': distinct,
+        'min': lo, 'max': hi, 'top': top, 'sample': sample,
+    }, columns=PROFILE_COLUMNS)
+    profile.index = df.columns
+    return profile, exact
+
 # Regola del 30% di Malizia per affidabilità della media
-def malizia_30_percent_rule(df):
+def malizia_30_percent_rule(df, stats=None):
     """
     Regola del 30% del Prof. Malizia:
     Se std < 30% della media → media affidabile
     Se std >= 30% della media → meglio usare mediana
     """
+    return malizia_from_stats(numeric_stats_table(df) if stats is None else stats)
+
+def malizia_from_stats(stats):
     results = {}
-    for col in df.select_dtypes(include=np.number).columns:
-        if df[col].count() > 0:  # Evita divisione per zero
-            mean_val = df[col].mean()
-            std_val = df[col].std()
+    for col, row in stats.iterrows():
+        if row['count'] > 0:  # Evita divisione per zero
+            mean_val = row['mean']
+            std_val = row['std']
             if mean_val != 0:  # Evita divisione per zero
                 std_percent = (std_val / abs(mean_val)) * 100
                 is_reliable = std_percent < 30
@@ -87,7 +1393,7 @@ def malizia_30_percent_rule(df):
                     'std_percent': round(std_percent, 2),
                     'mean_reliable': is_reliable,
                     'recommended': 'Media' if is_reliable else 'Mediana',
-                    'median': round(df[col].median(), 4)
+                    'median': round(row['50%'], 4)
                 }
             else:
                 results[col] = {
@@ -96,12 +1402,12 @@ def malizia_30_percent_rule(df):
                     'std_percent': float('inf'),
                     'mean_reliable': False,
                     'recommended': 'Mediana',
-                    'median': round(df[col].median(), 4)
+                    'median': round(row['50%'], 4)
                 }
     return results
 
 # Test di normalità e asimmetria (Fischer)
-def normality_analysis(df):
+def normality_analysis(df, stats=None):
     """
     Analisi della normalità secondo Fischer:
     - Kurtosis ≈ 0 → distribuzione normale
@@ -109,11 +1415,14 @@ def normality_analysis(df):
     - Asimmetria tra -1/-0.5 e 0.5/1 → moderatamente distorti
     - Asimmetria < -1 o > 1 → molto distorti
     """
+    return normality_from_stats(numeric_stats_table(df) if stats is None else stats)
+
+def normality_from_stats(stats):
     results = {}
-    for col in df.select_dtypes(include=np.number).columns:
-        if df[col].count() > 2:  # Serve almeno 3 valori
-            skewness = df[col].skew()
-            kurt = df[col].kurtosis()
+    for col, row in stats.iterrows():
+        if row['count'] > 2:  # Serve almeno 3 valori
+            skewness = row['skew']
+            kurt = row['kurt']
             
             # Classificazione asimmetria
             if -0.5 <= skewness <= 0.5:
@@ -149,14 +1458,15 @@ def normality_analysis(df):
     return results
 
 # Suggerimento automatico per metodo di correlazione
-def suggest_correlation_method(df, outlier_info):
+def suggest_correlation_method(df, outlier_info, stats=None, normality=None):
     """
     Suggerisce il metodo di correlazione basato su:
     - Normalità dei dati → Pearson
     - Dati non normali → Spearman
     - Molti outlier → Kendall Tau
     """
-    normality = normality_analysis(df)
+    if normality is None:
+        normality = normality_analysis(df, stats)
     suggestions = {}
     
     for col in df.select_dtypes(include=np.number).columns:
@@ -185,37 +1495,1075 @@ def suggest_correlation_method(df, outlier_info):
     
     return suggestions
 
+# === CORRELAZIONI BASATE SUI RANGHI (Spearman, Kendall) ===
+
+# Ranghi densi (0, 1, 2, ...) di una colonna: -1 per i valori mancanti
+def dense_ranks(values):
+    ranks = np.full(len(values), -1, dtype=np.int64)
+    valid = ~np.isnan(values)
+    ranks[valid] = np.unique(values[valid], return_inverse=True)[1]
+    return ranks
+
+# Conteggio delle inversioni con un merge sort bottom-up vettorizzato
+def count_inversions(values):
+    """
+    Numero di coppie i < j con values[i] > values[j] (gli uguali non contano).
+    Un solo argsort stabile ordina le posizioni per valore; poi, dal blocco
+    più grande ai più piccoli, la sequenza ordinata di ogni blocco di
+    ampiezza 2w viene divisa in modo stabile nelle sue due metà (somme
+    cumulative, O(n)). Prima della divisione, per ogni elemento della metà
+    destra, gli elementi della metà sinistra che lo seguono nella sequenza
+    sono quelli maggiori: in totale O(n log n).
+    """
+    a = np.asarray(values)
+    n = len(a)
+    if n < 2:
+        return 0
+    dtype = np.int32 if n < 2 ** 30 else np.int64
+    seq = np.argsort(a, kind='stable').astype(dtype, copy=False)
+    index = np.arange(n, dtype=dtype)
+    inversions = 0
+    width = 1 << ((n - 1).bit_length() - 1)
+    while width >= 1:
+        # Blocchi di ampiezza potenza di 2: inizio del blocco e metà con operazioni sui bit
+        start = seq & ~dtype(2 * width - 1)
+        is_left = (seq & dtype(width)) == 0
+        left_cum = np.zeros(n + 1, dtype=dtype)
+        np.cumsum(is_left, out=left_cum[1:])
+        block_left = left_cum[start]
+        left_before = left_cum[:n] - block_left
+        left_total = left_cum[np.minimum(start + 2 * width, n)] - block_left
+        right = ~is_left
+        inversions += int(left_total[right].sum(dtype=np.int64) - left_before[right].sum(dtype=np.int64))
+        target = np.where(is_left, start + left_before, index + left_total - left_before)
+        reordered = np.empty_like(seq)
+        reordered[target] = seq
+        seq = reordered
+        width //= 2
+    return inversions
+
+# Numero di coppie a pari merito in un array ordinato
+def _tied_pairs(ordered):
+    if len(ordered) < 2:
+        return 0
+    breaks = np.flatnonzero(np.diff(ordered)) + 1
+    runs = np.diff(np.concatenate(([0], breaks, [len(ordered)])))
+    return int(np.sum(runs * (runs - 1) // 2))
+
+# Tau-b di Kendall in O(n log n) (algoritmo di Knight)
+def kendall_tau_b(x, y):
+    """
+    x, y: ranghi interi senza mancanti. Ordinando per (x, y) le coppie
+    discordanti sono esattamente le inversioni di y.
+    """
+    n = len(x)
+    if n < 2:
+        return np.nan
+    order = np.lexsort((y, x))
+    xs, ys = x[order], y[order]
+    n0 = n * (n - 1) // 2
+    ties_x = _tied_pairs(xs)
+    ties_y = _tied_pairs(np.sort(ys))
+    # Pari merito congiunti: stessa x e stessa y consecutive dopo il lexsort
+    joint = np.flatnonzero((np.diff(xs) != 0) | (np.diff(ys) != 0)) + 1
+    runs = np.diff(np.concatenate(([0], joint, [n])))
+    ties_xy = int(np.sum(runs * (runs - 1) // 2))
+    discordant = count_inversions(ys)
+    denom = np.sqrt(float(n0 - ties_x) * float(n0 - ties_y))
+    if denom == 0:
+        return np.nan
+    return (n0 - ties_x - ties_y + ties_xy - 2 * discordant) / denom
+
+# Ranghi per colonna, calcolati una sola volta e riusati per tutte le coppie
+def rank_block(block, method):
+    """Kendall: ranghi densi; Spearman: ranghi medi; Pearson: nessun rango."""
+    if method == "kendall":
+        return np.column_stack([dense_ranks(block[:, j]) for j in range(block.shape[1])]).astype(float)
+    if method == "spearman":
+        return pd.DataFrame(block).rank().to_numpy(dtype=float)
+    return block
+
+# Correlazione di una coppia di colonne sulle righe in cui sono entrambe presenti
+def pair_correlation(values, ranks, i, j, method):
+    valid_i, valid_j = ~np.isnan(values[:, i]), ~np.isnan(values[:, j])
+    mask = valid_i & valid_j
+    if mask.sum() < 2:
+        return np.nan
+    if method == "kendall":
+        return kendall_tau_b(ranks[mask, i].astype(np.int64), ranks[mask, j].astype(np.int64))
+    if method == "spearman":
+        # I ranghi già calcolati valgono se il pattern dei mancanti coincide
+        x = ranks[mask, i] if (valid_i == mask).all() else stats.rankdata(values[mask, i])
+        y = ranks[mask, j] if (valid_j == mask).all() else stats.rankdata(values[mask, j])
+    else:
+        x, y = values[mask, i], values[mask, j]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.corrcoef(x, y)[0, 1]
+
+def correlation_pairs(values, ranks, pairs, method):
+    return np.array([pair_correlation(values, ranks, i, j, method) for i, j in pairs])
+
+# === CORRELAZIONE PARALLELA SU UN POOL DI PROCESSI ===
+
+# Processi massimi per Kendall (1 = nessun pool, limitato ai core) e coppie per blocco di lavoro
+CORR_WORKERS = max(min(int(os.environ.get("PYNAPP_CORR_WORKERS", "1")), os.cpu_count() or 1), 1)
+CORR_PAIRS_PER_TASK = 64
+
+# Stato dei processi worker: i blocchi in memoria condivisa
+_CORR_SHARED = {}
+
+def _corr_worker_init(values_name, ranks_name, shape):
+    for key, name in (("values", values_name), ("ranks", ranks_name)):
+        shm = shared_memory.SharedMemory(name=name)
+        _CORR_SHARED[key + "_shm"] = shm
+        _CORR_SHARED[key] = np.ndarray(shape, dtype=float, buffer=shm.buf, order='F')
+
+def _corr_worker_task(pairs, method):
+    return pairs, correlation_pairs(_CORR_SHARED["values"], _CORR_SHARED["ranks"], pairs, method)
+
+# Copia di un blocco in memoria condivisa (layout per colonna)
+def _to_shared(block):
+    shm = shared_memory.SharedMemory(create=True, size=max(block.nbytes, 1))
+    np.ndarray(block.shape, dtype=float, buffer=shm.buf, order='F')[:] = block
+    return shm
+
+def _parallel_correlation_pairs(values, ranks, pairs, method, workers, on_progress=None):
+    """
+    Le coppie sono divise in blocchi da CORR_PAIRS_PER_TASK e calcolate dai
+    processi worker, che leggono valori e ranghi dalla memoria condivisa.
+    on_progress viene chiamata dopo ogni blocco: se solleva un'eccezione
+    (in Streamlit succede quando l'utente cambia un widget e parte un rerun)
+    i blocchi in coda vengono annullati e la memoria condivisa liberata.
+    """
+    tasks = [pairs[k:k + CORR_PAIRS_PER_TASK] for k in range(0, len(pairs), CORR_PAIRS_PER_TASK)]
+    result = np.full(len(pairs), np.nan)
+    position = {pair: k for k, pair in enumerate(pairs)}
+    shm_values, shm_ranks = _to_shared(values), _to_shared(ranks)
+    executor = ProcessPoolExecutor(
+        max_workers=min(workers, len(tasks)),
+        mp_context=mp.get_context("fork"),
+        initializer=_corr_worker_init,
+        initargs=(shm_values.name, shm_ranks.name, values.shape)
+    )
+    try:
+        futures = [executor.submit(_corr_worker_task, task, method) for task in tasks]
+        for done, future in enumerate(as_completed(futures), start=1):
+            task, values_out = future.result()
+            result[[position[pair] for pair in task]] = values_out
+            if on_progress:
+                on_progress(done / len(tasks))
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        for shm in (shm_values, shm_ranks):
+            shm.close()
+            shm.unlink()
+    return result
+
+# Matrice di correlazione con il metodo scelto
+def correlation_matrix(num, method, workers=1, on_progress=None):
+    """
+    Ranghi calcolati una volta per colonna, poi le coppie:
+    - Spearman: le colonne senza mancanti condividono un'unica np.corrcoef
+      sui ranghi; le altre coppie vengono riclassificate sulle righe valide
+    - Kendall: tau-b in O(n log n) per ogni coppia
+    - Pearson: sempre DataFrame.corr (una sola passata vettoriale)
+    Con workers > 1 le coppie di Kendall sono calcolate in parallelo (solo
+    dove è disponibile il fork dei processi, altrimenti in serie).
+    """
+    if method == "pearson":
+        return num.corr(method=method)
+    parallel = method == "kendall" and workers > 1 and fork_pool_available(_corr_worker_task)
+
+    values = np.asfortranarray(num.to_numpy(dtype=float, na_value=np.nan))
+    ranks = np.asfortranarray(rank_block(values, method))
+    p = values.shape[1]
+    valid = ~np.isnan(values)
+    corr = np.full((p, p), np.nan)
+
+    complete = valid.all(axis=0) if method == "spearman" else np.zeros(p, dtype=bool)
+    full = np.flatnonzero(complete)
+    if len(full) and len(values) > 1:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            corr[np.ix_(full, full)] = np.corrcoef(ranks[:, full], rowvar=False)
+
+    pairs = [(i, j) for i in range(p) for j in range(i + 1, p) if not (complete[i] and complete[j])]
+    if parallel and len(pairs) > CORR_PAIRS_PER_TASK:
+        pair_values = _parallel_correlation_pairs(values, ranks, pairs, method, workers, on_progress)
+    else:
+        pair_values = correlation_pairs(values, ranks, pairs, method)
+    if pairs:
+        rows, cols = np.array(pairs).T
+        corr[rows, cols] = corr[cols, rows] = pair_values
+
+    # Diagonale come pandas: Kendall 1 se c'è almeno un valore, gli altri NaN sulle colonne costanti
+    if method == "kendall":
+        diagonal = np.where(valid.any(axis=0), 1.0, np.nan)
+    else:
+        with np.errstate(invalid='ignore'):
+            varying = np.nanmax(values, axis=0, initial=-np.inf) > np.nanmin(values, axis=0, initial=np.inf)
+        diagonal = np.where(varying, 1.0, np.nan)
+    np.fill_diagonal(corr, diagonal)
+    return pd.DataFrame(corr, index=num.columns, columns=num.columns)
+
+# Coppie di colonne molto correlate (triangolo superiore, senza cicli Python)
+def high_correlation_pairs(corr, threshold=0.8, top_k=None):
+    """
+    DataFrame (col_a, col_b, coeff) ordinato per |r| decrescente:
+    tutte le coppie con |r| > threshold (None = nessuna soglia),
+    eventualmente limitate alle prime top_k.
+    """
+    values = corr.to_numpy(dtype=float)
+    i, j = np.triu_indices(values.shape[0], k=1)
+    r = values[i, j]
+    abs_r = np.abs(r)
+    keep = ~np.isnan(abs_r)
+    if threshold is not None:
+        keep &= abs_r > threshold
+    i, j, r, abs_r = i[keep], j[keep], r[keep], abs_r[keep]
+
+    if top_k is not None and top_k < len(r):
+        part = np.argpartition(-abs_r, top_k - 1)[:top_k]  # Solo le prime k, poi ordinate
+        order = part[np.argsort(-abs_r[part], kind='stable')]
+    else:
+        order = np.argsort(-abs_r, kind='stable')
+    return pd.DataFrame({
+        'col_a': corr.index[i[order]],
+        'col_b': corr.columns[j[order]],
+        'coeff': r[order]
+    })
+
+# Gruppi di colonne ridondanti: un rappresentante e le colonne correlate direttamente con lui
+def redundant_column_groups(pairs, columns):
+    """
+    Ogni gruppo è ordinato come le colonne originali: la prima si tiene,
+    le altre sono candidate alla rimozione in blocco. Le colonne si
+    visitano in ordine: una colonna ancora libera diventa rappresentante
+    delle colonne libere correlate direttamente con lei (in una catena
+    A–B–C con A e C poco correlate, C non finisce nel gruppo di A).
+    """
+    if pairs.empty:
+        return []
+    position = pd.Index(columns)
+    a = position.get_indexer(pairs['col_a'])
+    b = position.get_indexer(pairs['col_b'])
+    neighbours = {}
+    for i, j in zip(a, b):
+        neighbours.setdefault(i, []).append(j)
+        neighbours.setdefault(j, []).append(i)
+
+    assigned = np.zeros(len(position), dtype=bool)
+    groups = []
+    for idx in sorted(neighbours):
+        if assigned[idx]:
+            continue
+        members = sorted(j for j in neighbours[idx] if not assigned[j])
+        if not members:
+            continue
+        assigned[idx] = assigned[members] = True
+        groups.append([position[idx]] + [position[j] for j in members])
+    return sorted(groups, key=len, reverse=True)
+
+# === HEATMAP DELLE CORRELAZIONI PER MATRICI LARGHE ===
+
+# Soglie di rendering: valori nelle celle, tabella colorata, heatmap cella per cella
+CORR_TEXT_MAX_COLS = 30
+CORR_STYLER_MAX_COLS = 50
+CORR_HEATMAP_MAX_COLS = int(os.environ.get("PYNAPP_CORR_HEATMAP_MAX_COLS", "150"))
+CORR_BLOCKS = 40
+
+# Clustering gerarchico delle colonne sulla distanza 1 - |r|
+def correlation_clusters(corr):
+    """
+    Legame medio sulla matrice delle distanze (i NaN contano come r = 0).
+    Restituisce {"order": posizioni delle colonne nell'ordine delle foglie
+    del dendrogramma, "linkage": matrice di linkage} per colonne vicine
+    quando molto correlate (positivamente o negativamente).
+    """
+    n = len(corr.columns)
+    if n < 3:
+        return {"order": list(range(n)), "linkage": None}
+    from scipy.cluster.hierarchy import leaves_list, linkage
+    from scipy.spatial.distance import squareform
+
+    dist = 1 - np.abs(np.nan_to_num(corr.to_numpy(dtype=float), nan=0.0))
+    dist = np.clip((dist + dist.T) / 2, 0, None)
+    np.fill_diagonal(dist, 0)
+    Z = linkage(squareform(dist, checks=False), method="average")
+    return {"order": leaves_list(Z).tolist(), "linkage": Z}
+
+# Gruppi di colonne per l'aggregazione a blocchi: dai cluster o, senza, a fette contigue
+def correlation_groups(corr, clusters, n_groups):
+    columns = corr.columns
+    if clusters is None or clusters["linkage"] is None:
+        return [columns[part].tolist() for part in np.array_split(np.arange(len(columns)), n_groups)]
+    from scipy.cluster.hierarchy import fcluster
+
+    labels = fcluster(clusters["linkage"], n_groups, criterion="maxclust")
+    groups = {}
+    for idx in clusters["order"]:  # Gruppi nell'ordine del dendrogramma
+        groups.setdefault(labels[idx], []).append(columns[idx])
+    return list(groups.values())
+
+# Matrice aggregata: correlazione media tra le colonne di ogni coppia di gruppi
+def correlation_blocks(corr, groups):
+    """
+    Due prodotti matriciali con l'indicatrice dei gruppi: somme e conteggi
+    delle correlazioni valide per blocco. Sulla diagonale si escludono le
+    coppie di una colonna con sé stessa (gruppo di una colonna = 1).
+    """
+    position = pd.Index(corr.columns)
+    member = np.zeros((len(position), len(groups)))
+    for g, cols in enumerate(groups):
+        member[position.get_indexer(cols), g] = 1.0
+    values = corr.to_numpy(dtype=float)
+    valid = ~np.isnan(values)
+    totals = member.T @ np.where(valid, values, 0.0) @ member
+    counts = member.T @ valid @ member
+    diag = np.diag_indices(len(groups))
+    totals[diag] -= member.T @ np.where(np.diag(valid), np.diag(values), 0.0)
+    counts[diag] -= member.T @ np.diag(valid).astype(float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        blocks = np.where(counts > 0, totals / np.where(counts > 0, counts, 1), np.nan)
+    singles = np.array([len(cols) == 1 for cols in groups])
+    blocks[diag] = np.where(singles, 1.0, blocks[diag])
+    labels = [f"G{g + 1} ({len(cols)})" for g, cols in enumerate(groups)]
+    return pd.DataFrame(blocks, index=labels, columns=labels)
+
+# Heatmap con payload limitato: valori nelle celle solo per matrici piccole
+def correlation_figure(corr, title):
+    text = max(corr.shape) <= CORR_TEXT_MAX_COLS
+    return px.imshow(
+        corr.round(3),
+        text_auto=True if text else False,
+        aspect="auto" if corr.shape[0] != corr.shape[1] else None,
+        title=title,
+        color_continuous_scale='RdBu_r',
+        zmin=-1, zmax=1
+    )
+
+# Heatmap di una matrice di correlazione: cella per cella fino a CORR_HEATMAP_MAX_COLS colonne,
+# oltre a blocchi di gruppi con il dettaglio di una coppia di gruppi
+def correlation_heatmap(corr, title, clusters=None):
+    corr_cols = len(corr.columns)
+    if corr_cols <= CORR_HEATMAP_MAX_COLS:
+        shown = corr.iloc[clusters["order"], clusters["order"]] if clusters is not None else corr
+        st.plotly_chart(correlation_figure(shown, title), use_container_width=True)
+    else:
+        n_groups = st.slider("Gruppi di colonne nella heatmap", 2, min(CORR_HEATMAP_MAX_COLS, corr_cols),
+                             min(CORR_BLOCKS, corr_cols))
+        groups = correlation_groups(corr, clusters, n_groups)
+        blocks = correlation_blocks(corr, groups)
+        st.plotly_chart(correlation_figure(blocks, f"{title} per gruppi di colonne"), use_container_width=True)
+        st.caption(f"{corr_cols} colonne aggregate in {len(groups)} gruppi"
+                   f"{' dal clustering gerarchico' if clusters is not None else ' contigui'}: ogni cella è la "
+                   "correlazione media tra le colonne dei due gruppi (sulla diagonale, tra colonne diverse)")
+
+        # Dettaglio di una coppia di gruppi, cella per cella
+        col_a, col_b = st.columns(2)
+        with col_a:
+            group_a = st.selectbox("Dettaglio: gruppo sulle righe", range(len(groups)), format_func=lambda g: blocks.index[g])
+        with col_b:
+            group_b = st.selectbox("Dettaglio: gruppo sulle colonne", range(len(groups)), index=group_a,
+                                   format_func=lambda g: blocks.index[g])
+        rows_a, cols_b = groups[group_a], groups[group_b]
+        if max(len(rows_a), len(cols_b)) > CORR_HEATMAP_MAX_COLS:
+            st.caption(f"Dettaglio limitato alle prime {CORR_HEATMAP_MAX_COLS} colonne di ogni gruppo")
+        detail = corr.loc[rows_a[:CORR_HEATMAP_MAX_COLS], cols_b[:CORR_HEATMAP_MAX_COLS]]
+        st.plotly_chart(correlation_figure(detail, f"{blocks.index[group_a]} × {blocks.index[group_b]}"),
+                        use_container_width=True)
+
 # Statistiche numeriche avanzate
-def describe_numeric_advanced(df):
-    desc = df.describe().T
-    desc['median'] = df.median(numeric_only=True)
-    desc['iqr'] = df.quantile(0.75) - df.quantile(0.25)
-    desc['missing'] = df.isnull().sum()
+def describe_numeric_advanced(df, stats=None):
+    return describe_from_stats(numeric_stats_table(df) if stats is None else stats)
+
+def describe_from_stats(stats):
+    desc = stats[['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max']].copy()
+    desc['median'] = stats['50%']
+    desc['iqr'] = stats['75%'] - stats['25%']
+    desc['missing'] = stats['missing']
     
     # Aggiungi regola del 30% di Malizia
-    malizia_results = malizia_30_percent_rule(df)
+    malizia_results = malizia_from_stats(stats)
     desc['std_percent'] = [malizia_results.get(col, {}).get('std_percent', 0) for col in desc.index]
     desc['recommended_stat'] = [malizia_results.get(col, {}).get('recommended', 'N/A') for col in desc.index]
     
     return desc
 
 # Rilevamento outlier
-def detect_outliers(df):
+def detect_outliers(df, stats=None):
+    stats = numeric_stats_table(df) if stats is None else stats
+    return outliers_from_counts(stats, stats['outliers'].to_numpy())
+
+# Limiti IQR (Q1 - 1.5×IQR, Q3 + 1.5×IQR) per ogni colonna
+def iqr_bounds(stats):
+    iqr = (stats['75%'] - stats['25%']).to_numpy()
+    return stats['25%'].to_numpy() - 1.5 * iqr, stats['75%'].to_numpy() + 1.5 * iqr
+
+def outliers_from_counts(stats, counts):
+    lower, upper = iqr_bounds(stats)
     outliers = {}
-    for col in df.select_dtypes(include=np.number).columns:
-        q1 = df[col].quantile(0.25)
-        q3 = df[col].quantile(0.75)
-        iqr = q3 - q1
-        lower = q1 - 1.5 * iqr
-        upper = q3 + 1.5 * iqr
-        mask = (df[col] < lower) | (df[col] > upper)
+    for i, col in enumerate(stats.index):
+        n_rows = stats['n_rows'].iloc[i]
         outliers[col] = {
-            "count": mask.sum(),
-            "percentage": round(mask.mean() * 100, 2),
-            "bounds": (round(lower, 2), round(upper, 2))
+            "count": int(counts[i]),
+            "percentage": round(counts[i] / n_rows * 100, 2) if n_rows else 0.0,
+            "bounds": (round(lower[i], 2), round(upper[i], 2))
         }
     return outliers
 
+# === SMART ADVISOR ===
+
+# Profilo delle colonne su cui lavorano tutte le regole dell'advisor
+def advisor_profile(df, stats, columns=None):
+    """
+    Una riga per colonna del dataset: valori distinti dal profilo delle
+    colonne (column_profile), e per le colonne numeriche momenti, mediana
+    e quota di outlier presi dalla tabella delle statistiche.
+    """
+    if columns is None:
+        columns, _ = column_profile(df)
+    profile = pd.DataFrame({
+        'distinct': columns['distinct'],
+        'is_float': [pd.api.types.is_float_dtype(df[col]) for col in df.columns],
+    }, index=df.columns)
+    numeric = stats[['count', 'mean', 'std', '50%', 'skew', 'kurt', 'outliers', 'n_rows']].rename(columns={'50%': 'median'})
+    profile = profile.join(numeric, how='left')
+    with np.errstate(invalid='ignore', divide='ignore'):
+        profile['std_percent'] = np.where(profile['mean'] != 0, profile['std'] / profile['mean'].abs() * 100, np.inf)
+        profile['outlier_pct'] = np.where(profile['n_rows'] > 0, profile['outliers'] / profile['n_rows'] * 100, 0.0)
+    return profile
+
+# Regole: ricevono il profilo e il numero di righe, restituiscono una lista di messaggi
+def _rule_size(profile, n_rows):
+    return ["📉 Pochi dati: i risultati potrebbero non essere rappresentativi."] if n_rows < 50 else []
+
+def _rule_constant(profile, n_rows):
+    return [f"🟨 La colonna `{col}` ha un solo valore unico → poco informativa."
+            for col in profile.index[profile['distinct'] == 1]]
+
+def _rule_cardinality(profile, n_rows):
+    high = (profile['distinct'] != 1) & (profile['distinct'] / max(n_rows, 1) > 0.9)
+    return [f"🟨 La colonna `{col}` ha altissima cardinalità ({int(d)} valori unici)."
+            for col, d in profile.loc[high, 'distinct'].items()]
+
+def _rule_low_variance(profile, n_rows):
+    low = (profile['distinct'] != 1) & (profile['distinct'] / max(n_rows, 1) <= 0.9) & profile['is_float'] & (profile['std'] < 1e-3)
+    return [f"🔍 La colonna `{col}` ha una varianza molto bassa → quasi costante." for col in profile.index[low]]
+
+def _rule_malizia(profile, n_rows):
+    unreliable = (profile['count'] > 0) & ~(profile['std_percent'] < 30)
+    return [f"📏 **Regola Malizia**: Per `{col}` usa la **mediana** ({round(row['median'], 4)}) invece della media (std = {round(row['std_percent'], 2)}%)"
+            for col, row in profile[unreliable].iterrows()]
+
+def _rule_normality(profile, n_rows):
+    tested = profile[profile['count'] > 2]
+    messages = []
+    for col, row in tested.iterrows():
+        if abs(row['kurt']) < 0.5 and abs(row['skew']) <= 0.5:
+            continue
+        if not -1 <= row['skew'] <= 1:
+            messages.append(f"📊 `{col}` è molto distorta (asimmetria = {round(row['skew'], 4)}) → considera trasformazioni (log, sqrt)")
+        if not abs(row['kurt']) < 1:
+            messages.append(f"📊 `{col}` non segue distribuzione normale (kurtosis = {round(row['kurt'], 4)}) → usa test non parametrici")
+    return messages
+
+def _rule_outliers(profile, n_rows):
+    return [f"🚨 `{col}` ha {round(pct, 2)}% outlier → potrebbe influenzare media o regressioni."
+            for col, pct in profile['outlier_pct'].items() if round(pct, 2) > 10]
+
+# Regole dell'advisor nell'ordine di valutazione: per aggiungerne una basta una voce
+ADVISOR_RULES = [
+    ("Dimensione del dataset", _rule_size),
+    ("Colonne costanti", _rule_constant),
+    ("Cardinalità elevata", _rule_cardinality),
+    ("Varianza quasi nulla", _rule_low_variance),
+    ("Regola del 30% (Malizia)", _rule_malizia),
+    ("Normalità (Fischer)", _rule_normality),
+    ("Outlier IQR", _rule_outliers),
+]
+
+# Valuta tutte le regole sullo stesso profilo, misurando il tempo di ognuna
+def run_advisor(profile, n_rows, rules=None):
+    messages, timings = [], []
+    for name, rule in ADVISOR_RULES if rules is None else rules:
+        start = time.perf_counter()
+        found = rule(profile, n_rows)
+        timings.append({"Regola": name, "Messaggi": len(found), "ms": (time.perf_counter() - start) * 1000})
+        messages.extend(found)
+    return messages, pd.DataFrame(timings, columns=["Regola", "Messaggi", "ms"])
+
+# === CACHE SU DISCO DEI DATASET PULITI ===
+
+# Cartella (una per utente di sistema) e budget (MB, 0 = disattivata) della cache su disco,
+# condivisa da sessioni e processi dello stesso utente
+_CACHE_OWNER = str(os.getuid()) if hasattr(os, "getuid") else os.environ.get("USERNAME", "user")
+DISK_CACHE_DIR = os.environ.get("PYNAPP_DISK_CACHE_DIR",
+                                os.path.join(tempfile.gettempdir(), f"pynapp_cache_{_CACHE_OWNER}"))
+DISK_CACHE_MB = int(os.environ.get("PYNAPP_DISK_CACHE_MB", "2048"))
+
+# Chiave di una voce: hash delle parti (hash del file, opzioni...)
+def disk_cache_key(*parts):
+    return hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()
+
+def _disk_cache_path(key):
+    return os.path.join(DISK_CACHE_DIR, f"{key}.arrow")
+
+# Cartella della cache con permessi 0o700 (ristretti se già esiste); False se appartiene a un altro utente
+def _disk_cache_dir_ready():
+    os.makedirs(DISK_CACHE_DIR, mode=0o700, exist_ok=True)
+    if not hasattr(os, "getuid"):
+        return True
+    info = os.stat(DISK_CACHE_DIR)
+    if info.st_uid != os.getuid():
+        return False
+    if info.st_mode & 0o077:
+        os.chmod(DISK_CACHE_DIR, 0o700)
+    return True
+
+# Lettura di una voce (memory map, poi conversione in pandas con copia): (DataFrame, metadati) oppure None
+def disk_cache_get(key):
+    if not DISK_CACHE_MB or not HAS_PYARROW:
+        return None
+    import pyarrow as pa
+    path = _disk_cache_path(key)
+    try:
+        if not _disk_cache_dir_ready():
+            return None
+        table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+        os.utime(path)  # L'mtime fa da orologio LRU
+    except (OSError, pa.ArrowException):
+        return None
+    meta = json.loads((table.schema.metadata or {}).get(b"pynapp", b"{}"))
+    return table.to_pandas(), meta
+
+# Scrittura atomica di una voce (Arrow IPC non compresso)
+def disk_cache_put(key, df, meta):
+    """Restituisce False se il dataframe non è convertibile in Arrow o la cache è disattivata."""
+    if not DISK_CACHE_MB or not HAS_PYARROW:
+        return False
+    import pyarrow as pa
+    path = _disk_cache_path(key)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        if not _disk_cache_dir_ready():
+            return False
+        table = pa.Table.from_pandas(df)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), b"pynapp": json.dumps(meta)})
+        with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(tmp, path)
+    except (OSError, pa.ArrowException, TypeError, ValueError):
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return False
+    _disk_cache_evict()
+    return os.path.exists(path)
+
+# Eliminazione delle voci usate meno di recente oltre il budget
+def _disk_cache_evict():
+    entries = []
+    with os.scandir(DISK_CACHE_DIR) as it:
+        for entry in it:
+            if entry.name.endswith(".arrow"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= DISK_CACHE_MB * 1024 ** 2:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= size
+
+# Report della pulizia ↔ JSON (le tabelle come DataFrame in formato split)
+def _report_to_json(report):
+    return {k: {"frame": v.to_json(orient="split")} if isinstance(v, pd.DataFrame) else v
+            for k, v in report.items()}
+
+def _report_from_json(meta):
+    return {k: pd.read_json(io.StringIO(v["frame"]), orient="split", dtype=False, convert_dates=False)
+            if isinstance(v, dict) else v for k, v in meta.items()}
+
+# Dataset pulito dalla cache su disco, oppure caricato, pulito e salvato
+def cached_clean_data(file, load_options, clean_options, df=None):
+    """
+    Chiave: hash del file + opzioni di caricamento + opzioni di pulizia.
+    Restituisce (DataFrame pulito, report, secondi di apertura dal disco o None).
+    """
+    key = disk_cache_key("clean", file_hash(file), sorted(load_options.items()), sorted(clean_options.items()))
+    start = time.perf_counter()
+    hit = disk_cache_get(key)
+    if hit is not None:
+        clean_df, meta = hit
+        return clean_df, _report_from_json(meta), time.perf_counter() - start
+    if df is None:
+        df, _ = load_data(file, load_options)
+    source = disk_cache_key("load", file_hash(file), sorted(load_options.items()))
+    clean_df, report = clean_data(df, clean_options, source)
+    disk_cache_put(key, clean_df, _report_to_json(report))
+    return clean_df, report, None
+
+# === MEMOIZZAZIONE DEI RISULTATI PER SESSIONE ===
+
+# Numero di dataset ricordati per sessione
+MEMO_MAX_DATASETS = 4
+
+# Risultato di un'analisi calcolato una sola volta per dataset pulito
+def memoized(name, fingerprint, compute):
+    """
+    I risultati vivono in st.session_state, raggruppati per impronta del
+    dataset (al più MEMO_MAX_DATASETS impronte, le più vecchie escono).
+    """
+    memo = st.session_state.setdefault("analysis_memo", OrderedDict())
+    if fingerprint not in memo:
+        memo[fingerprint] = {}
+        while len(memo) > MEMO_MAX_DATASETS:
+            memo.popitem(last=False)
+    memo.move_to_end(fingerprint)
+    results = memo[fingerprint]
+    if name not in results:
+        results[name] = compute()
+    return results[name]
+
+# === GRAFO DELLE ANALISI ===
+
+# Stadi dell'analisi e loro input: altri stadi o parametri della sessione
+ANALYSIS_STAGES = {
+    "clean": ("upload", "clean_options"),
+    "sample": ("clean", "preview"),
+    "stats": ("sample", "sketch_k"),
+    "malizia": ("stats",),
+    "normality": ("stats",),
+    "describe": ("stats",),
+    "outliers": ("stats",),
+    "correlation": ("sample", "corr_method"),
+    "clustering": ("correlation",),
+    "columns": ("clean", "distinct_error"),
+    "profile": ("columns", "stats"),
+    "advisor": ("profile",),
+}
+
+# Stadi il cui risultato è un DataFrame: in memo resta solo la versione corrente
+FRAME_STAGES = ("clean", "sample")
+
+# Versioni degli stadi e risultati memoizzati di un rerun
+class AnalysisGraph:
+    """
+    - la versione di un parametro è il suo valore, quella di uno stadio è
+      l'hash del nome e delle versioni dei suoi input (ANALYSIS_STAGES)
+    - i risultati stanno nella memo della sessione sotto nome e versione
+      dello stadio, raggruppati per versione del dataset pulito
+    Se cambia un parametro cambiano solo le versioni degli stadi a valle:
+    quelli vengono ricalcolati, gli altri riusati (anche tornando a opzioni
+    già viste). Il registro dice cosa è successo a ogni stadio nel rerun.
+    I DataFrame di FRAME_STAGES non si accumulano: tornando a una versione
+    vecchia il dataset pulito si rilegge dalla cache su disco.
+    """
+    def __init__(self, **params):
+        self.params = params
+        self.versions = {}
+        self.log = {}
+
+    # Parametri noti solo più avanti nello script (es. il metodo di correlazione)
+    def set(self, **params):
+        self.params.update(params)
+        self.versions = {}
+
+    def version(self, stage):
+        if stage not in ANALYSIS_STAGES:
+            return repr(self.params.get(stage))
+        if stage not in self.versions:
+            self.versions[stage] = disk_cache_key(stage, [self.version(i) for i in ANALYSIS_STAGES[stage]])
+        return self.versions[stage]
+
+    def key(self, stage):
+        return f"{stage}@{self.version(stage)}"
+
+    def run(self, stage, compute):
+        computed = False
+
+        def compute_stage():
+            nonlocal computed
+            computed = True
+            return compute()
+
+        result = memoized(self.key(stage), self.version("clean"), compute_stage)
+        self.log.setdefault(stage, "ricalcolato" if computed else "riusato")
+        if stage in FRAME_STAGES:
+            self._drop_stale(stage)
+        return result
+
+    def _drop_stale(self, stage):
+        current = self.key(stage)
+        for results in st.session_state.get("analysis_memo", {}).values():
+            for name in [n for n in results if n.startswith(f"{stage}@") and n != current]:
+                del results[name]
+
+    def mark(self, stage, status):
+        self.log[stage] = status
+
+    def background(self, stage, compute, **params):
+        """Come run con i parametri sostituiti, ma in un thread: None finché non è pronto."""
+        other = AnalysisGraph(**{**self.params, **params})
+        return background_result(other.key(stage), other.version("clean"), compute)
+
+    def report(self):
+        return pd.DataFrame([{
+            "Stadio": stage,
+            "Input": ", ".join(inputs),
+            "Stato": self.log.get(stage, "non richiesto"),
+            "Versione": self.version(stage)[:8],
+        } for stage, inputs in ANALYSIS_STAGES.items()])
+
+# Stadio "stats": tabella delle statistiche, esatta o dagli sketch KLL
+def stats_stage(graph, df):
+    sketch_k = graph.params.get("sketch_k")
+    return numeric_stats_table(df, build_column_sketches(df, sketch_k) if sketch_k else None)
+
+# === TABELLE PAGINATE LATO SERVER ===
+
+# Righe per pagina delle tabelle di risultati
+TABLE_PAGE_ROWS = 50
+
+# Tabella di risultati con filtro, ordinamento e paginazione lato server
+def paged_table(table, key, style=None, page_rows=TABLE_PAGE_ROWS):
+    """
+    Filtro testuale (indice e celle) e ordinamento per una colonna girano
+    sul server; al browser arriva solo la pagina visibile e lo stile
+    (funzione DataFrame → Styler) viene costruito solo per quella.
+    Le tabelle che stanno in una pagina sono mostrate senza controlli.
+    """
+    if len(table) <= page_rows:
+        st.dataframe(style(table) if style else table, use_container_width=True)
+        return
+
+    col_filter, col_sort, col_order = st.columns([2, 2, 1])
+    with col_filter:
+        query = st.text_input("Filtra righe", key=f"{key}_filter", placeholder="Testo nell'indice o nelle celle")
+    with col_sort:
+        sort_pos = st.selectbox("Ordina per", [-1] + list(range(table.shape[1])), key=f"{key}_sort",
+                                format_func=lambda i: "(indice)" if i < 0 else str(table.columns[i]))
+    with col_order:
+        descending = st.checkbox("Decrescente", key=f"{key}_desc")
+
+    view = table
+    if query:
+        mask = view.index.astype(str).str.contains(query, case=False, regex=False)
+        for col in range(view.shape[1]):
+            mask |= view.iloc[:, col].astype(str).str.contains(query, case=False, regex=False).to_numpy()
+        view = view[mask]
+    if sort_pos >= 0 or descending:
+        keys = view.iloc[:, sort_pos] if sort_pos >= 0 else view.index.to_series()
+        keys = keys.reset_index(drop=True)
+        try:
+            order = keys.sort_values(ascending=not descending, na_position="last", kind="stable").index
+        except TypeError:  # Colonne con tipi misti: ordinamento come testo
+            order = keys.astype(str).sort_values(ascending=not descending, kind="stable").index
+        view = view.iloc[order]
+
+    pages = max(-(-len(view) // page_rows), 1)
+    if st.session_state.get(f"{key}_page", 1) > pages:
+        st.session_state[f"{key}_page"] = pages
+    page = st.number_input(f"Pagina (di {pages})", min_value=1, max_value=pages, key=f"{key}_page")
+    start = (page - 1) * page_rows
+    shown = view.iloc[start:start + page_rows]
+    st.dataframe(style(shown) if style else shown, use_container_width=True)
+    filtered = f" (filtrate da {len(table):,})" if len(view) != len(table) else ""
+    st.caption(f"Righe {min(start + 1, len(view)):,}–{start + len(shown):,} di {len(view):,}{filtered}")
+
+# === ANTEPRIMA VELOCE SU CAMPIONE ===
+
+# Righe del campione di default per l'anteprima
+PREVIEW_SAMPLE_ROWS = 50_000
+
+# Campione casuale (o stratificato per una colonna) di un DataFrame
+def sample_frame(df, n_rows, strata=None, seed=0):
+    """
+    Senza strati: campione casuale semplice senza reinserimento.
+    Con strati: allocazione proporzionale con il metodo dei resti più
+    grandi, il totale resta n_rows anche con moltissimi gruppi (quelli
+    con quota sotto una riga possono restare fuori). Le righe di ogni
+    gruppo sono scelte ordinando per gruppo e chiave casuale, senza cicli.
+    """
+    if len(df) <= n_rows:
+        return df
+    if strata is None:
+        return df.sample(n=n_rows, random_state=seed).sort_index()
+    rng = np.random.default_rng(seed)
+    codes = df.groupby(strata, dropna=False, sort=False, observed=True).ngroup().to_numpy()
+    sizes = np.bincount(codes)
+    quota = sizes * (n_rows / len(df))
+    take = np.floor(quota).astype(np.int64)
+    extra = np.lexsort((rng.random(len(sizes)), take - quota))[:n_rows - int(take.sum())]
+    take[extra] += 1
+    order = np.lexsort((rng.random(len(df)), codes))
+    rank = np.empty(len(df), dtype=np.int64)
+    rank[order] = np.arange(len(df)) - (np.cumsum(sizes) - sizes)[codes[order]]
+    return df.iloc[np.flatnonzero(rank < take[codes])]
+
+# Semi-ampiezze degli intervalli di confidenza al 95% per le statistiche di un campione
+def preview_intervals(stats, n_total, z=1.96):
+    """
+    - media: z·s/√n con correzione per popolazione finita
+    - asimmetria e curtosi: errori standard classici in funzione di n
+    - percentuale di outlier: intervallo di Wilson
+    """
+    n = stats['count'].to_numpy()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        fpc = np.sqrt(np.clip((n_total - n) / max(n_total - 1, 1), 0, 1))
+        mean_half = z * stats['std'].to_numpy() / np.sqrt(n) * fpc
+        skew_se = np.sqrt(6 * n * (n - 1) / ((n - 2) * (n + 1) * (n + 3)))
+        kurt_se = 2 * skew_se * np.sqrt((n * n - 1) / ((n - 3) * (n + 5)))
+        rows = stats['n_rows'].to_numpy()
+        p = stats['outliers'].to_numpy() / rows
+        centre = (p + z * z / (2 * rows)) / (1 + z * z / rows)
+        spread = z * np.sqrt(p * (1 - p) / rows + z * z / (4 * rows * rows)) / (1 + z * z / rows)
+    return pd.DataFrame({
+        'mean': mean_half,
+        'skew': z * skew_se,
+        'kurt': z * kurt_se,
+        'outliers_low': np.clip(centre - spread, 0, 1) * 100,
+        'outliers_high': np.clip(centre + spread, 0, 1) * 100
+    }, index=stats.index)
+
+# Semi-ampiezza dell'IC al 95% di una correlazione vicina a r (trasformata di Fisher)
+def correlation_interval(r, n, z=1.96):
+    if n <= 3:
+        return np.nan
+    r = np.clip(r, -0.999999, 0.999999)
+    lo, hi = np.tanh(np.arctanh(r) - z / np.sqrt(n - 3)), np.tanh(np.arctanh(r) + z / np.sqrt(n - 3))
+    return (hi - lo) / 2
+
+# Thread per i calcoli esatti in background, condivisi da tutte le sessioni
+@st.cache_resource
+def get_background_executor():
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="pynapp-exact")
+
+def background_result(name, fingerprint, compute):
+    """
+    Restituisce il risultato esatto se è già pronto (e lo sposta nella memo
+    della sessione), altrimenti avvia compute() in un thread e restituisce None.
+    I lavori stanno in st.session_state: finiscono con la sessione, e quelli
+    ancora in coda per un altro dataset vengono annullati. Se compute
+    solleva un'eccezione resta l'anteprima, con un avviso, senza riprovare.
+    compute non deve usare st.*: gira fuori dal run dello script.
+    """
+    memo = st.session_state.get("analysis_memo", {})
+    if name in memo.get(fingerprint, {}):
+        return memo[fingerprint][name]
+    jobs = st.session_state.setdefault("background_jobs", {})
+    key = (fingerprint, name)
+    future = jobs.get(key)
+    if future is None:
+        for other in [k for k in jobs if k[0] != fingerprint]:
+            jobs.pop(other).cancel()
+        jobs[key] = get_background_executor().submit(compute)
+        return None
+    if not future.done():
+        return None
+    error = future.exception()
+    if error is not None:
+        st.warning(f"⚠️ Calcolo esatto non riuscito ({name.split('@')[0]}): {error}")
+        return None
+    del jobs[key]
+    return memoized(name, fingerprint, future.result)
+
+# === INGESTIONE IN STREAMING (file più grandi della memoria) ===
+
+# Estensioni leggibili a blocchi e dimensioni di default
+STREAMABLE_EXTENSIONS = [".csv", ".tsv", ".parquet", ".jsonl", ".ndjson"]
+STREAM_CHUNK_ROWS = 200_000
+
+# Lettura a blocchi del file caricato
+def iter_file_chunks(file, ext, chunk_rows=STREAM_CHUNK_ROWS):
+    """
+    Genera DataFrame di al più chunk_rows righe:
+    - CSV/TSV: lettore a blocchi del motore C (formato indovinato dal prefisso)
+    - Parquet: batch dei row group
+    - JSON-lines: batch del lettore JSON, appiattiti alla profondità di default
+    """
+    file.seek(0)
+    if ext in [".csv", ".tsv"]:
+        fmt = sniff_csv_format(file, ext)
+        reader = pd.read_csv(file, sep=fmt["sep"], encoding=fmt["encoding"],
+                             header=0 if fmt["header"] else None, chunksize=chunk_rows, engine="c")
+        for chunk in reader:
+            if not fmt["header"]:
+                chunk.columns = [f"colonna_{i + 1}" for i in range(chunk.shape[1])]
+            yield chunk
+    elif ext == ".parquet":
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(file).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+    elif ext in [".jsonl", ".ndjson"]:
+        yield from iter_json_frames(file, ext, batch_rows=chunk_rows)
+    else:
+        raise ValueError(f"Formato {ext} non supportato in streaming")
+
+# Momenti centrali (n, media, M2, M3, M4) di un blocco 2-D, colonna per colonna
+def block_moments(block):
+    mask = ~np.isnan(block)
+    n = mask.sum(axis=0).astype(float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(n > 0, np.nansum(block, axis=0) / n, 0.0)
+    dev = np.where(mask, block - mean, 0.0)
+    dev2 = dev * dev
+    return n, mean, dev2.sum(axis=0), (dev2 * dev).sum(axis=0), (dev2 * dev2).sum(axis=0)
+
+# Unione dei momenti di due gruppi di righe (formule di Chan/Pébay)
+def merge_moments(a, b):
+    na, ma, a2, a3, a4 = a
+    nb, mb, b2, b3, b4 = b
+    n = na + nb
+    delta = mb - ma
+    with np.errstate(invalid='ignore', divide='ignore'):
+        d_n = np.where(n > 0, delta / np.where(n > 0, n, 1), 0.0)
+    mean = ma + d_n * nb
+    m2 = a2 + b2 + delta * d_n * na * nb
+    m3 = (a3 + b3 + delta * d_n ** 2 * na * nb * (na - nb)
+          + 3 * d_n * (na * b2 - nb * a2))
+    m4 = (a4 + b4 + delta * d_n ** 3 * na * nb * (na * na - na * nb + nb * nb)
+          + 6 * d_n ** 2 * (na * na * b2 + nb * nb * a2) + 4 * d_n * (na * b3 - nb * a3))
+    return n, mean, m2, m3, m4
+
+# Media, deviazione standard, asimmetria e curtosi (come pandas) dai momenti
+def moments_to_stats(moments):
+    n, mean, m2, m3, m4 = moments
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(n > 0, mean, np.nan)
+        std = np.where(n > 1, np.sqrt(m2 / (n - 1)), np.nan)
+        flat = m2 <= 1e-14 * np.maximum(n, 1) * np.maximum(mean * mean, 1)  # Colonna costante
+        skew = np.where(n > 2, n * np.sqrt(n - 1) / (n - 2) * m3 / m2 ** 1.5, np.nan)
+        skew = np.where((n > 2) & flat, 0.0, skew)
+        kurt = (n * (n + 1) * (n - 1) * m4 / ((n - 2) * (n - 3) * m2 ** 2)
+                - 3 * (n - 1) ** 2 / ((n - 2) * (n - 3)))
+        kurt = np.where(n > 3, np.where(flat, 0.0, kurt), np.nan)
+    return mean, std, skew, kurt
+
+# Aggregatore incrementale per l'analisi in streaming
+class StreamingStats:
+    """
+    Accumula blocco dopo blocco, senza tenere il dataset in memoria:
+    - momenti fino al quarto ordine, minimo e massimo per colonna
+    - co-momenti a coppie per la correlazione di Pearson
+    - uno sketch KLL per colonna per i quantili
+    Le colonne numeriche sono fissate dal primo blocco; nei successivi
+    vengono convertite a numero (i valori non numerici diventano NaN).
+    """
+    def __init__(self, k=KLL_K):
+        self.k = k
+        self.columns = None
+        self.n_rows = 0
+
+    def numeric_block(self, chunk):
+        chunk = _normalize_columns(chunk)
+        if self.columns is None:
+            self.columns = list(chunk.select_dtypes(include=np.number).columns)
+        num = chunk.reindex(columns=self.columns)
+        for col in num.columns:
+            if not pd.api.types.is_numeric_dtype(num[col]):
+                num[col] = pd.to_numeric(num[col], errors='coerce')
+        return num.to_numpy(dtype=float, na_value=np.nan)
+
+    def update(self, chunk):
+        block = self.numeric_block(chunk)
+        if self.n_rows == 0:
+            p = block.shape[1]
+            self.moments = tuple(np.zeros(p) for _ in range(5))
+            self.min = np.full(p, np.inf)
+            self.max = np.full(p, -np.inf)
+            self.missing = np.zeros(p)
+            with np.errstate(invalid='ignore'):
+                self._shift = np.nan_to_num(np.nanmean(block, axis=0)) if len(block) else np.zeros(p)
+            self._pair_n = np.zeros((p, p))
+            self._pair_sx = np.zeros((p, p))
+            self._pair_sxx = np.zeros((p, p))
+            self._pair_sxy = np.zeros((p, p))
+            self.sketches = {col: KLLSketch(self.k, seed=j) for j, col in enumerate(self.columns)}
+        if not len(block):
+            return
+
+        self.moments = merge_moments(self.moments, block_moments(block))
+        mask = ~np.isnan(block)
+        self.missing += (~mask).sum(axis=0)
+        self.min = np.fmin(self.min, np.nanmin(np.where(mask, block, np.inf), axis=0))
+        self.max = np.fmax(self.max, np.nanmax(np.where(mask, block, -np.inf), axis=0))
+
+        # Co-momenti sulle righe in cui entrambe le colonne sono presenti (traslati per stabilità)
+        m = mask.astype(float)
+        x0 = np.where(mask, block - self._shift, 0.0)
+        self._pair_n += m.T @ m
+        self._pair_sx += x0.T @ m
+        self._pair_sxx += (x0 * x0).T @ m
+        self._pair_sxy += x0.T @ x0
+
+        for j, col in enumerate(self.columns):
+            self.sketches[col].update(block[:, j])
+        self.n_rows += len(block)
+
+    def stats(self):
+        """Tabella nel formato di numeric_stats_table (quantili stimati dagli sketch)."""
+        if self.columns is None or self.n_rows == 0:
+            return pd.DataFrame(columns=STATS_COLUMNS, dtype=float)
+        mean, std, skew, kurt = moments_to_stats(self.moments)
+        q1, q2, q3 = sketch_quartiles(self.sketches, self.columns)
+        n = self.moments[0]
+        return pd.DataFrame({
+            'count': n, 'mean': mean, 'std': std,
+            'min': np.where(n > 0, self.min, np.nan), '25%': q1, '50%': q2, '75%': q3,
+            'max': np.where(n > 0, self.max, np.nan),
+            'skew': skew, 'kurt': kurt, 'missing': self.missing, 'n_rows': float(self.n_rows),
+            'outliers': np.nan  # Richiede una seconda passata
+        }, index=self.columns, columns=STATS_COLUMNS)
+
+    def pearson(self):
+        """Matrice di Pearson a coppie complete, come DataFrame.corr()."""
+        n, sx, sxx, sxy = self._pair_n, self._pair_sx, self._pair_sxx, self._pair_sxy
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cov = sxy - sx * sx.T / n
+            var_x = sxx - sx * sx / n
+            corr = cov / np.sqrt(var_x * var_x.T)
+        corr = np.clip(corr, -1, 1)
+        np.fill_diagonal(corr, np.where(np.diag(var_x) > 0, 1.0, np.nan))
+        return pd.DataFrame(corr, index=self.columns, columns=self.columns)
+
+# Analisi completa di un file in streaming (due passate a blocchi)
+def stream_analysis(file, ext, chunk_rows=STREAM_CHUNK_ROWS, on_progress=None):
+    """
+    Prima passata: momenti, co-momenti e sketch (StreamingStats).
+    Seconda passata: conteggio esatto degli outlier con i limiti IQR.
+    Restituisce stats, outlier, correlazione di Pearson e sketch.
+    """
+    agg = StreamingStats()
+    for i, chunk in enumerate(iter_file_chunks(file, ext, chunk_rows)):
+        agg.update(chunk)
+        if on_progress:
+            on_progress(0.5 * _stream_position(file), f"Blocco {i + 1}: {agg.n_rows:,} righe lette")
+    stats = agg.stats()
+
+    lower, upper = iqr_bounds(stats)
+    counts = np.zeros(len(stats))
+    for chunk in iter_file_chunks(file, ext, chunk_rows):
+        block = agg.numeric_block(chunk)
+        counts += ((block < lower) | (block > upper)).sum(axis=0)
+        if on_progress:
+            on_progress(0.5 + 0.5 * _stream_position(file), "Conteggio outlier")
+    stats['outliers'] = counts
+
+    return {
+        "stats": stats,
+        "outliers": detect_outliers(None, stats),
+        "corr": agg.pearson(),
+        "sketches": agg.sketches if agg.columns is not None else {},
+        "n_rows": agg.n_rows
+    }
+
+def _stream_position(file):
+    size = file.size if hasattr(file, "size") else len(file.getbuffer())
+    return min(file.tell() / size, 1.0) if size else 1.0
+
 # === GUIDA UNIFICATA COMPLETA ===
 with st.expander("📖 GUIDA COMPLETA ALL'ANALISI DATI - Prof. Malizia", expanded=False):
     st.markdown("""
@@ -463,27 +2811,257 @@ with st.expander("📖 GUIDA COMPLETA ALL'ANALISI DATI - Prof. Malizia", expande
     """)
 
 # Upload file
-uploaded_file = st.file_uploader("📁 Carica un file", type=["csv", "tsv", "xlsx", "xls", "json", "pdf", "html", "parquet", "feather"])
+uploaded_file = st.file_uploader("📁 Carica un file", type=["csv", "tsv", "xlsx", "xls", "json", "jsonl", "ndjson", "pdf", "html", "parquet", "feather"])
+
+if DEBUG_TOOLS:
+    with st.expander("⏱️ Benchmark lettura CSV", expanded=False):
+        st.caption("Confronta la lettura originale (separatore indovinato dal motore Python) con quella veloce su un CSV sintetico")
+        bench_rows = st.number_input("Numero di righe", min_value=10_000, max_value=5_000_000, value=1_000_000, step=100_000)
+        if st.button("▶️ Esegui benchmark"):
+            with st.spinner("Benchmark in corso..."):
+                st.dataframe(benchmark_csv_loaders(int(bench_rows)), use_container_width=True)
 
 df = None
 if uploaded_file:
-    df = load_data(uploaded_file)
-    if df is not None:
-        st.success("✅ File caricato con successo")
+    with st.expander("⚙️ Opzioni di caricamento"):
+        csv_mode = st.radio(
+            "Lettura CSV/TSV",
+            ["fast", "python"],
+            format_func=lambda m: {"fast": "Veloce (pyarrow / C)", "python": "Compatibile (motore Python)"}[m],
+            horizontal=True
+        )
+        streaming = st.checkbox(
+            "Modalità streaming (file più grandi della memoria)",
+            value=False,
+            help="CSV, TSV, Parquet e JSON-lines vengono letti a blocchi: le statistiche sono calcolate senza caricare l'intero dataset"
+        )
+        chunk_rows = st.number_input("Righe per blocco", min_value=10_000, max_value=2_000_000,
+                                     value=STREAM_CHUNK_ROWS, step=50_000, disabled=not streaming)
+        upload_ext = os.path.splitext(uploaded_file.name.lower())[-1]
+        if upload_ext == ".pdf":
+            pdf_table = st.number_input("Tabella del PDF da caricare", min_value=1, value=1, step=1,
+                                        help="Le tabelle che proseguono su più pagine con la stessa intestazione vengono unite")
+        if upload_ext in [".xlsx", ".xls"]:
+            try:
+                sheet = st.selectbox("Foglio Excel", excel_sheet_names(uploaded_file, upload_ext))
+                sheet_columns = excel_columns(uploaded_file, upload_ext, sheet)
+            except Exception:  # File illeggibile: l'errore viene mostrato dal caricamento
+                sheet, sheet_columns = 0, []
+            # Posizioni e non nomi: read_excel tratta gli interi in usecols come indici
+            usecols = sorted(sheet_columns.index(c) for c in
+                             st.multiselect("Colonne da caricare (vuoto = tutte)", sheet_columns))
+        if upload_ext in [".parquet", ".feather"] and HAS_PYARROW:
+            schema = columnar_schema(uploaded_file, upload_ext)
+            columnar_columns = st.multiselect("Colonne da leggere (vuoto = tutte)", list(schema))
+            n_filters = st.number_input("Filtri sulle righe", min_value=0, max_value=3, value=0, step=1,
+                                        help="Per Parquet i row group esclusi dai filtri non vengono nemmeno decodificati")
+            columnar_filters = []
+            for k in range(int(n_filters)):
+                col_f, col_op, col_v = st.columns([2, 1, 2])
+                name = col_f.selectbox("Colonna", list(schema), key=f"filter_col_{k}")
+                op = col_op.selectbox("Operatore", COLUMNAR_FILTER_OPS, key=f"filter_op_{k}")
+                text = col_v.text_input("Valore", key=f"filter_value_{k}")
+                if text.strip():
+                    try:
+                        columnar_filters.append((name, op, parse_filter_value(text, schema[name])))
+                    except ValueError:
+                        st.warning(f"⚠️ Valore non valido per `{name}` ({schema[name]}): filtro ignorato")
+        if upload_ext in [".json", ".jsonl", ".ndjson"]:
+            json_depth = st.number_input("Livelli JSON annidati da espandere in colonne", min_value=0, max_value=6,
+                                         value=JSON_FLATTEN_DEPTH, step=1,
+                                         help="Oltre questo livello gli oggetti (e sempre le liste) restano come testo JSON")
+    load_options = {"csv_mode": csv_mode}
+    if upload_ext in [".json", ".jsonl", ".ndjson"]:
+        load_options["json_depth"] = int(json_depth)
+    if upload_ext in [".parquet", ".feather"] and HAS_PYARROW:
+        load_options.update({"columns": columnar_columns, "filters": columnar_filters})
+    if upload_ext == ".pdf":
+        load_options["pdf_table"] = int(pdf_table) - 1
+    if upload_ext in [".xlsx", ".xls"]:
+        load_options.update({"sheet": sheet, "usecols": usecols})
+
+    df, load_info, raw_columns = None, {}, None
+    if streaming and upload_ext not in STREAMABLE_EXTENSIONS:
+        st.warning(f"⚠️ La modalità streaming non supporta i file {upload_ext}: caricamento completo")
+    if streaming and upload_ext in STREAMABLE_EXTENSIONS:
+        # Le sezioni successive lavorano sul dataset completo: qui non è disponibile
+        st.session_state.pop("df_clean", None)
+        st.session_state.pop("analysis_graph", None)
+        st.session_state.pop("analysis_df", None)
+
+        stream_key = ("stream", upload_ext, file_hash(uploaded_file), int(chunk_rows))
+        result = get_upload_cache().get(stream_key)
+        if result is None:
+            progress = st.progress(0.0, text="Lettura a blocchi...")
+            try:
+                result = stream_analysis(uploaded_file, upload_ext, int(chunk_rows),
+                                         on_progress=lambda frac, msg: progress.progress(frac, text=msg))
+                # In cache solo tabelle e sketch: dimensioni indipendenti dal numero di righe
+                nbytes = estimate_nbytes([result["stats"], result["corr"]]) + sum(
+                    sketch.nbytes for sketch in result["sketches"].values())
+                get_upload_cache().put(stream_key, result, nbytes=nbytes)
+            except Exception as e:
+                st.error(f"Errore nella lettura in streaming: {e}")
+            progress.empty()
+
+        if result is not None:
+            st.success(f"✅ Analisi in streaming completata: {result['n_rows']:,} righe")
+            st.caption(f"Quantili e mediane stimati con sketch KLL (errore di rango ≤ {2 / KLL_K:.1%}); "
+                       "medie, deviazioni e correlazioni sono esatte")
+
+            st.markdown("### 📏 Regola del 30% (Prof. Malizia)")
+            malizia_stream = malizia_from_stats(result["stats"])
+            if malizia_stream:
+                st.dataframe(pd.DataFrame(malizia_stream).T, use_container_width=True)
+
+            st.markdown("### 📌 Statistiche Numeriche Avanzate")
+            st.dataframe(describe_from_stats(result["stats"]))
+
+            st.markdown("### 🚨 Outlier Rilevati")
+            for col, info in result["outliers"].items():
+                if info['count'] > 0:
+                    st.warning(f"Colonna `{col}`: {info['count']} outlier ({info['percentage']}%) [Range: {info['bounds'][0]} - {info['bounds'][1]}]")
+                else:
+                    st.info(f"Colonna `{col}`: Nessun outlier significativo rilevato")
+
+            st.markdown("### 🔗 Matrice di Correlazione (Pearson)")
+            stream_corr = result["corr"]
+            if len(stream_corr.columns) >= 2:
+                # Stessi limiti della pagina completa: matrici larghe ordinate per cluster e aggregate a blocchi
+                wide = len(stream_corr.columns) > CORR_TEXT_MAX_COLS
+                correlation_heatmap(stream_corr, "Matrice di Correlazione (Pearson)",
+                                    correlation_clusters(stream_corr) if wide else None)
+            st.info("ℹ️ Le sezioni seguenti richiedono il caricamento completo: disattiva la modalità streaming per usarle")
+    else:
+        # File già visto (anche da un'altra sessione): nomi delle colonne dalla cache su disco, lettura rimandata
+        upload_key = disk_cache_key("header", file_hash(uploaded_file), sorted(load_options.items()))
+        header = disk_cache_get(upload_key)
+        if header is not None:
+            raw_columns, load_info = header[1]["columns"], {**header[1]["load_info"], "cached": True}
+        else:
+            df, load_info = load_data(uploaded_file, load_options)
+            if df is not None:
+                raw_columns = [str(c) for c in df.columns]
+                disk_cache_put(upload_key, pd.DataFrame(), {
+                    "columns": raw_columns,
+                    "load_info": {"engine": load_info["engine"], "seconds": load_info["seconds"]},
+                })
+    if raw_columns is not None:
+        if load_info["cached"]:
+            st.success("✅ File caricato con successo (dalla cache)")
+        else:
+            st.success(f"✅ File caricato con successo in {load_info['seconds']:.2f}s")
+        st.caption(f"Motore di lettura: `{load_info['engine']}`")
 
         with st.expander("🧼 Opzioni di pulizia"):
             remove_dups = st.checkbox("Rimuovi duplicati", value=True)
+            clean_names = _normalize_columns(pd.DataFrame(columns=raw_columns)).columns.tolist()
+            dup_subset = st.multiselect("Colonne chiave dei duplicati (vuoto = tutte)", clean_names,
+                                        disabled=not remove_dups)
+            dup_keep = {"Prima": "first", "Ultima": "last", "Nessuna": False}[
+                st.radio("Occorrenza da tenere", ["Prima", "Ultima", "Nessuna"], horizontal=True,
+                         disabled=not remove_dups)
+            ]
+            dup_bits = 128 if st.checkbox("Impronte a 128 bit", value=False, disabled=not remove_dups,
+                                          help="Per tabelle molto grandi: rende impossibili in pratica le collisioni di hash") else 64
             missing_opt = st.radio("Gestione valori mancanti", ["Mantieni", "Rimuovi", "Riempi con 0"])
+            compact = st.checkbox(
+                "Compatta in memoria",
+                value=False,
+                help="Numeri al tipo più piccolo senza perdita di precisione, testo ripetitivo come categoria, il resto come stringhe pyarrow"
+            )
 
-        if remove_dups:
-            df.drop_duplicates(inplace=True)
-        if missing_opt == "Rimuovi":
-            df.dropna(inplace=True)
-        elif missing_opt == "Riempi con 0":
-            df.fillna(0, inplace=True)
+        clean_options = {
+            "remove_dups": remove_dups, "dup_subset": dup_subset, "dup_keep": dup_keep, "dup_bits": dup_bits,
+            "missing_opt": missing_opt, "compact": compact,
+        }
+        graph = AnalysisGraph(upload=upload_key, clean_options=clean_options)
 
-        df = clean_data(df)
+        # La pulizia gira una volta per file e opzioni: nei rerun si riusa il risultato,
+        # nelle nuove sessioni lo si riapre dalla cache su disco
+        df, clean_report, disk_seconds = graph.run(
+            "clean", lambda: cached_clean_data(uploaded_file, load_options, clean_options, df)
+        )
+        if disk_seconds is not None:
+            st.caption(f"💾 Dataset pulito aperto dalla cache su disco in {disk_seconds:.2f}s")
+        input_mb = clean_report.get("input_mb")
+        memory = f"picco di memoria stimato {clean_report['peak_mb']:.1f} MB" + (
+            f", di cui {input_mb:.1f} MB di dataset caricato" if input_mb is not None else "")
+        with st.expander(f"🧹 Pipeline di pulizia ({memory})"):
+            st.dataframe(clean_report["steps"].style.format({"ms": "{:.1f}"}), use_container_width=True)
+            if remove_dups:
+                removed = clean_report["steps"].set_index("Passo").loc["Rimuovi duplicati", "Rimosse"]
+                st.caption(f"🔁 Righe duplicate rimosse: {removed:,}")
+        with st.expander(f"🔎 Schema dedotto ({clean_report['seconds'] * 1000:.0f} ms)"):
+            if clean_report["schema"].empty:
+                st.caption("Nessuna colonna di testo da convertire")
+            else:
+                st.dataframe(clean_report["schema"], use_container_width=True)
+        if clean_report["compact"] is not None:
+            compact_report = clean_report["compact"]
+            before_mb, after_mb = compact_report["MB prima"].sum(), compact_report["MB dopo"].sum()
+            with st.expander(f"🗜️ Memoria: {before_mb:.1f} MB → {after_mb:.1f} MB"):
+                st.dataframe(compact_report.style.format({"MB prima": "{:.3f}", "MB dopo": "{:.3f}"}),
+                             use_container_width=True)
         st.session_state["df_clean"] = df
+        # Le analisi sono stadi del grafo, condiviso da tutte le sezioni
+        st.session_state["analysis_graph"] = graph
+
+        with st.expander("📐 Opzioni di analisi"):
+            use_sketches = st.checkbox(
+                "Quantili approssimati (sketch KLL)",
+                value=False,
+                help="Mediana, quartili e limiti IQR stimati in una sola passata con errore di rango limitato, senza ordinare le colonne"
+            )
+            kll_k = st.select_slider("Precisione dello sketch (k)", options=[100, 200, 400, 800], value=KLL_K,
+                                     disabled=not use_sketches)
+            if use_sketches:
+                st.caption(f"Errore di rango massimo ≈ {2 / kll_k:.2%}")
+
+            st.markdown("---")
+            preview_mode = st.checkbox(
+                "⚡ Anteprima veloce su campione",
+                value=False,
+                help="Tutte le sezioni lavorano su un campione con intervalli di confidenza; i valori esatti vengono calcolati in background"
+            )
+            preview_rows = st.number_input("Righe del campione", min_value=1_000, max_value=1_000_000,
+                                           value=PREVIEW_SAMPLE_ROWS, step=5_000, disabled=not preview_mode)
+            preview_strata = st.selectbox("Stratifica per", ["Nessuna"] + df.select_dtypes(include=['object', 'category', 'string']).columns.tolist(),
+                                          disabled=not preview_mode)
+
+            st.markdown("---")
+            use_hll = st.checkbox(
+                "Valori distinti approssimati (HyperLogLog)",
+                value=False,
+                help=f"Conteggi dei valori unici stimati con uno sketch per colonna; sotto {HLL_EXACT_ROWS:,} righe restano esatti"
+            )
+            hll_error = st.select_slider("Errore relativo dei conteggi", options=[0.005, 0.01, 0.02, 0.04], value=HLL_ERROR,
+                                         format_func=lambda e: f"{e:.1%}", disabled=not use_hll)
+        sketch_k = kll_k if use_sketches else None
+        graph.set(sketch_k=sketch_k, preview=None, distinct_error=hll_error if use_hll else None)
+
+        # Anteprima: finché i valori esatti non sono pronti si lavora su un campione
+        preview_active = False
+        if preview_mode and len(df) > preview_rows:
+            exact_stats = graph.background(
+                "stats", lambda: numeric_stats_table(df, build_column_sketches(df, sketch_k) if sketch_k else None)
+            )
+            if exact_stats is None:
+                strata = None if preview_strata == "Nessuna" else preview_strata
+                graph.set(preview=(int(preview_rows), strata))
+                preview_active = True
+        analysis_df = graph.run("sample", lambda: sample_frame(df, *graph.params["preview"]) if preview_active else df)
+        st.session_state["analysis_df"] = analysis_df
+        st.session_state["preview_active"] = preview_active
+
+        stats_table = graph.run("stats", lambda: stats_stage(graph, analysis_df))
+        intervals = preview_intervals(stats_table, len(df)) if preview_active else None
+        if preview_active:
+            st.info(f"⚡ Anteprima su {len(analysis_df):,} righe campionate su {len(df):,}: "
+                    "i valori esatti sono in calcolo in background")
+            st.button("🔄 Aggiorna con i valori esatti")
+        elif preview_mode and len(df) > preview_rows:
+            st.success("✅ Valori esatti pronti: l'anteprima è stata sostituita")
 
         st.dataframe(df.head(), use_container_width=True)
 
@@ -491,13 +3069,15 @@ if uploaded_file:
         st.markdown("### 📏 Regola del 30% (Prof. Malizia)")
         st.info("**Regola**: Se la deviazione standard è < 30% della media → la media è affidabile, altrimenti usa la mediana")
         
-        malizia_analysis = malizia_30_percent_rule(df)
+        malizia_analysis = graph.run("malizia", lambda: malizia_30_percent_rule(analysis_df, stats_table))
         if malizia_analysis:
             malizia_df = pd.DataFrame(malizia_analysis).T
-            st.dataframe(malizia_df.style.apply(
+            if preview_active:
+                malizia_df['IC 95% media (±)'] = intervals['mean'].reindex(malizia_df.index).round(4)
+            paged_table(malizia_df, "malizia_table", style=lambda page: page.style.apply(
                 lambda x: ['background-color: lightgreen' if v else 'background-color: lightcoral' 
                           for v in x] if x.name == 'mean_reliable' else [''] * len(x), axis=0
-            ), use_container_width=True)
+            ))
 
         # --- TEST DI NORMALITÀ (FISCHER) ---
         with st.expander("📊 Test di Normalità e Asimmetria (Fischer)", expanded=False):
@@ -576,7 +3156,7 @@ if uploaded_file:
                 **📊 Kurtosis:** `≈ 0` = 🟢 Normale | `|k| < 1` = 🟡 | `|k| ≥ 1` = 🔴
                 """)
             
-            normality_results = normality_analysis(df)
+            normality_results = graph.run("normality", lambda: normality_analysis(analysis_df, stats_table))
             if normality_results:
                 # Crea una tabella riassuntiva
                 summary_data = []
@@ -591,6 +3171,9 @@ if uploaded_file:
                     })
                 
                 summary_df = pd.DataFrame(summary_data)
+                if preview_active:
+                    summary_df.insert(2, 'IC Skewness (±)', intervals['skew'].reindex(summary_df['Colonna']).round(4).to_numpy())
+                    summary_df.insert(5, 'IC Kurtosis (±)', intervals['kurt'].reindex(summary_df['Colonna']).round(4).to_numpy())
                 st.dataframe(summary_df, use_container_width=True)
                 
                 # Conteggio rapido
@@ -607,14 +3190,18 @@ if uploaded_file:
                 st.warning("Nessun dato numerico disponibile per il test di normalità")
 
         st.markdown("### 📌 Statistiche Numeriche Avanzate")
-        num_stats = describe_numeric_advanced(df.select_dtypes(include=np.number))
-        st.dataframe(num_stats)
+        num_stats = graph.run("describe", lambda: describe_numeric_advanced(analysis_df, stats_table))
+        if preview_active:
+            num_stats = num_stats.assign(**{'IC 95% media (±)': intervals['mean']})
+        paged_table(num_stats, "stats_table")
 
         st.markdown("### 🚨 Outlier Rilevati")
-        outlier_info = detect_outliers(df)
+        outlier_info = graph.run("outliers", lambda: detect_outliers(analysis_df, stats_table))
         for col, info in outlier_info.items():
             if info['count'] > 0:
-                st.warning(f"Colonna `{col}`: {info['count']} outlier ({info['percentage']}%) [Range: {info['bounds'][0]} - {info['bounds'][1]}]")
+                ci = (f" (IC 95%: {intervals.at[col, 'outliers_low']:.2f}% - {intervals.at[col, 'outliers_high']:.2f}%)"
+                      if preview_active else "")
+                st.warning(f"Colonna `{col}`: {info['count']} outlier ({info['percentage']}%){ci} [Range: {info['bounds'][0]} - {info['bounds'][1]}]")
             else:
                 st.info(f"Colonna `{col}`: Nessun outlier significativo rilevato")
 
@@ -623,13 +3210,18 @@ st.markdown("## 🔗 Analisi di Correlazione Avanzata")
 
 df = st.session_state.get("df_clean")
 if df is not None:
-    num_cols = df.select_dtypes(include=np.number)
+    graph = st.session_state["analysis_graph"]
+    analysis_df = st.session_state.get("analysis_df", df)
+    preview_active = st.session_state.get("preview_active", False)
+    stats_table = graph.run("stats", lambda: stats_stage(graph, analysis_df))
+    num_cols = analysis_df.select_dtypes(include=np.number)
 
     if not num_cols.empty:
         # Suggerimenti automatici per metodo di correlazione
         st.markdown("### 🎯 Suggerimenti per Metodo di Correlazione")
-        outlier_info = detect_outliers(df)
-        correlation_suggestions = suggest_correlation_method(df, outlier_info)
+        outlier_info = graph.run("outliers", lambda: detect_outliers(analysis_df, stats_table))
+        normality_results = graph.run("normality", lambda: normality_analysis(analysis_df, stats_table))
+        correlation_suggestions = suggest_correlation_method(analysis_df, outlier_info, stats_table, normality_results)
         
         if correlation_suggestions:
             st.info("**Raccomandazioni basate sui dati:**")
@@ -639,6 +3231,10 @@ if df is not None:
         # Selezione metodo con suggerimento
         st.markdown("### 🔧 Scegli il Metodo")
         method = st.selectbox("Metodo di correlazione", ["pearson", "spearman", "kendall"])
+        corr_workers = 1
+        if CORR_WORKERS > 1 and method == "kendall":
+            corr_workers = st.slider("Processi per il calcolo", 1, CORR_WORKERS, 1,
+                                     help="Le coppie di colonne vengono suddivise tra più processi")
         
         # Informazioni sui metodi
         method_info = {
@@ -648,30 +3244,60 @@ if df is not None:
         }
         st.info(method_info[method])
         
-        corr = num_cols.corr(method=method)
-        st.dataframe(corr.style.background_gradient(cmap="coolwarm"), use_container_width=True)
-
-        if len(num_cols.columns) >= 2:
-            fig = px.imshow(
-                corr,
-                text_auto=True,
-                title=f"Matrice di Correlazione ({method.title()})",
-                color_continuous_scale='RdBu_r',
-                zmin=-1, zmax=1
+        def compute_corr():
+            progress = st.progress(0.0, text=f"Calcolo della correlazione ({method})...")
+            # Ogni aggiornamento è anche un punto di annullamento: se l'utente cambia
+            # metodo durante il calcolo, Streamlit interrompe qui il run e i blocchi in coda
+            corr = correlation_matrix(num_cols, method, corr_workers,
+                                      on_progress=lambda frac: progress.progress(frac, text=f"Calcolo della correlazione ({method})..."))
+            progress.empty()
+            return corr
+
+        graph.set(corr_method=method)
+        corr = None
+        if preview_active:
+            full_num = df.select_dtypes(include=np.number)
+            corr = graph.background("correlation", lambda: correlation_matrix(full_num, method), preview=None)
+        if corr is None:
+            corr = graph.run("correlation", compute_corr)
+            if preview_active:
+                st.caption(f"⚡ Correlazioni sul campione di {len(num_cols):,} righe: IC 95% per r ≈ 0 di ± "
+                           f"{correlation_interval(0.0, len(num_cols)):.3f} (più stretto per |r| alti)")
+        # Matrici larghe: niente tabella colorata né valori nelle celle, oltre soglia heatmap a blocchi
+        corr_cols = len(corr.columns)
+        if corr_cols <= CORR_STYLER_MAX_COLS:
+            st.dataframe(corr.style.background_gradient(cmap="coolwarm"), use_container_width=True)
+        elif st.checkbox(f"Mostra la matrice completa ({corr_cols}×{corr_cols}) in tabella", value=False):
+            st.dataframe(corr.round(3), use_container_width=True)
+
+        if corr_cols >= 2:
+            clustered = st.checkbox(
+                "Ordina le colonne per cluster gerarchico",
+                value=corr_cols > CORR_TEXT_MAX_COLS,
+                help="Colonne molto correlate (anche negativamente) diventano vicine e formano blocchi visibili"
             )
-            st.plotly_chart(fig, use_container_width=True)
+            clusters = graph.run("clustering", lambda: correlation_clusters(corr)) if clustered else None
+            correlation_heatmap(corr, f"Matrice di Correlazione ({method.title()})", clusters)
+
+        col_thr, col_k = st.columns(2)
+        with col_thr:
+            corr_threshold = st.slider("Soglia |r| di ridondanza", 0.5, 0.99, 0.8, 0.01)
+        with col_k:
+            corr_top_k = st.number_input("Coppie da mostrare", min_value=1, value=50, step=10)
 
-        high_corr = []
-        for i in range(len(corr.columns)):
-            for j in range(i+1, len(corr.columns)):
-                val = corr.iloc[i, j]
-                if abs(val) > 0.8:
-                    high_corr.append((corr.index[i], corr.columns[j], val))
+        redundant_pairs = high_correlation_pairs(corr, corr_threshold)
+        if not redundant_pairs.empty:
+            shown = f" (mostrate le prime {corr_top_k} per |r|)" if len(redundant_pairs) > corr_top_k else ""
+            st.warning(f"⚠️ Correlazioni elevate rilevate: {len(redundant_pairs)} coppie{shown}")
+            paged_table(redundant_pairs.head(corr_top_k).reset_index(drop=True), "corr_pairs",
+                        style=lambda t: t.style.format({"coeff": "{:.2f}"}))
 
-        if high_corr:
-            st.warning("⚠️ Correlazioni elevate rilevate:")
-            for a, b, v in high_corr:
-                st.write(f"🔸 **{a}** e **{b}** → coeff = {v:.2f} → potenziale ridondanza")
+            groups = redundant_column_groups(redundant_pairs, corr.columns)
+            st.markdown("**🧩 Gruppi di colonne ridondanti** (si tiene la prima di ogni gruppo)")
+            for group in groups:
+                st.write(f"🔹 Tieni `{group[0]}` → ridondanti: {', '.join(f'`{c}`' for c in group[1:])}")
+            to_drop = [c for group in groups for c in group[1:]]
+            st.code(f"df = df.drop(columns={to_drop!r})", language="python")
 
         # Suggerimenti correlazione
         with st.expander("📘 Guida all'Interpretazione delle Correlazioni"):
@@ -701,40 +3327,16 @@ else:
 st.markdown("## 💡 Suggerimenti Automatici (Smart Advisor)")
 
 if df is not None:
-    messages = []
-    
-    # Consigli sulla dimensione del dataset
-    if df.shape[0] < 50:
-        messages.append("📉 Pochi dati: i risultati potrebbero non essere rappresentativi.")
-    
-    # Consigli sulle colonne
-    for col in df.columns:
-        if df[col].nunique() == 1:
-            messages.append(f"🟨 La colonna `{col}` ha un solo valore unico → poco informativa.")
-        elif df[col].nunique() / df.shape[0] > 0.9:
-            messages.append(f"🟨 La colonna `{col}` ha altissima cardinalità ({df[col].nunique()} valori unici).")
-        elif df[col].dtype == 'float' and df[col].std() < 1e-3:
-            messages.append(f"🔍 La colonna `{col}` ha una varianza molto bassa → quasi costante.")
-
-    # Consigli basati sulla regola del 30% di Malizia
-    malizia_results = malizia_30_percent_rule(df)
-    for col, result in malizia_results.items():
-        if not result['mean_reliable']:
-            messages.append(f"📏 **Regola Malizia**: Per `{col}` usa la **mediana** ({result['median']}) invece della media (std = {result['std_percent']}%)")
-
-    # Consigli basati sulla normalità
-    normality_results = normality_analysis(df)
-    for col, result in normality_results.items():
-        if not result['is_normal']:
-            if result['skew_classification'] == "Molto distorti":
-                messages.append(f"📊 `{col}` è molto distorta (asimmetria = {result['skewness']}) → considera trasformazioni (log, sqrt)")
-            if result['kurt_classification'] == "Non normale":
-                messages.append(f"📊 `{col}` non segue distribuzione normale (kurtosis = {result['kurtosis']}) → usa test non parametrici")
-
-    # Consigli sugli outlier
-    for col, out in detect_outliers(df).items():
-        if out["percentage"] > 10:
-            messages.append(f"🚨 `{col}` ha {out['percentage']}% outlier → potrebbe influenzare media o regressioni.")
+    # Un solo profilo delle colonne, valutato da tutte le regole di ADVISOR_RULES
+    profile_start = time.perf_counter()
+    columns_profile, distinct_exact = graph.run("columns", lambda: column_profile(df, graph.params["distinct_error"], source=graph.version("clean")))
+    profile = graph.run("profile", lambda: advisor_profile(df, stats_table, columns_profile))
+    profile_ms = (time.perf_counter() - profile_start) * 1000
+    if preview_active:
+        st.caption("⚡ Suggerimenti statistici calcolati sul campione dell'anteprima")
+    if not distinct_exact:
+        st.caption(f"🔢 Valori unici stimati con HyperLogLog (errore ≤ {graph.params['distinct_error']:.1%})")
+    messages, rule_timings = graph.run("advisor", lambda: run_advisor(profile, len(df)))
 
     if messages:
         for msg in messages:
@@ -742,6 +3344,14 @@ if df is not None:
     else:
         st.success("✅ Nessun problema evidente rilevato. Dati appaiono bilanciati.")
 
+    with st.expander(f"⏱️ Regole dell'advisor ({rule_timings['ms'].sum():.1f} ms, profilo {profile_ms:.1f} ms)"):
+        st.caption(f"Profilo delle colonne: {graph.log['profile']}; regole: {graph.log['advisor']}")
+        st.dataframe(rule_timings.style.format({"ms": "{:.2f}"}), use_container_width=True)
+
+    with st.expander("🧭 Stadi dell'analisi in questo aggiornamento"):
+        st.caption("Ogni stadio viene ricalcolato solo se cambia uno dei suoi input; gli altri risultati vengono riusati")
+        st.dataframe(graph.report(), use_container_width=True)
+
 # --- LEGENDA INTERATTIVA POTENZIATA ---
 with st.expander("📘 Guida Completa alle Analisi (Regole Prof. Malizia)"):
     st.markdown("""
@@ -783,6 +3393,7 @@ st.markdown("## 📖 Generazione Narrativa con pyNarrative")
 
 if df is not None:
     st.info("💡 **Come utilizzare il DataFrame**: Il tuo dataset pulito è disponibile come variabile `df`")
+    columns_profile, distinct_exact = graph.run("columns", lambda: column_profile(df, graph.params["distinct_error"], source=graph.version("clean")))
     
     # Quick data summary for user reference
     with st.expander("📊 Riassunto del tuo Dataset", expanded=False):
@@ -792,27 +3403,30 @@ if df is not None:
         with col2:
             st.metric("Colonne", df.shape[1])
         with col3:
-            st.metric("Numeriche", len(df.select_dtypes(include=np.number).columns))
+            st.metric("Numeriche", int((columns_profile['kind'] == "numeric").sum()))
         with col4:
-            st.metric("Categoriche", len(df.select_dtypes(include='object').columns))
+            st.metric("Categoriche", int((columns_profile['kind'] == "text").sum()))
         
         # Show column details
         st.markdown("**📋 Colonne disponibili:**")
         cols_data = []
-        for col in df.columns:
-            dtype = str(df[col].dtype)
-            null_count = df[col].isnull().sum()
-            unique_count = df[col].nunique()
+        for col, info in zip(df.columns, columns_profile.itertuples(index=False)):
+            unique_count = int(info.distinct)
             cols_data.append({
                 'Colonna': col,
-                'Tipo': dtype,
-                'Valori Unici': f"{unique_count:,}",
-                'Valori Nulli': null_count,
-                'Esempio': str(df[col].iloc[0]) if len(df) > 0 else "N/A"
+                'Tipo': info.dtype,
+                'Valori Unici': f"{unique_count:,}" if distinct_exact else f"≈ {unique_count:,}",
+                'Valori Nulli': info.nulls,
+                'Min': "" if info.min is None or pd.isna(info.min) else str(info.min),
+                'Max': "" if info.max is None or pd.isna(info.max) else str(info.max),
+                'Più frequenti': ", ".join(f"{value} ({count:,})" for value, count in info.top),
+                'Esempio': str(info.sample) if info.sample is not None else "N/A"
             })
         
         cols_df = pd.DataFrame(cols_data)
-        st.dataframe(cols_df, use_container_width=True)
+        paged_table(cols_df, "columns_table")
+        if not distinct_exact:
+            st.caption("Valori unici stimati con HyperLogLog, frequenze stimate su un campione di righe")
     
     with st.expander("📚 Guida pyNarrative Completa", expanded=False):
         st.markdown("""
@@ -933,10 +3547,10 @@ if df is not None:
         ]
     )
     
-    # Get numeric and categorical columns
-    numeric_cols = df.select_dtypes(include=np.number).columns.tolist()
-    categorical_cols = df.select_dtypes(include=['object', 'category']).columns.tolist()
-    datetime_cols = df.select_dtypes(include=['datetime64']).columns.tolist()
+    # Colonne per famiglia, dal profilo delle colonne
+    numeric_cols = columns_profile.index[columns_profile['kind'] == "numeric"].tolist()
+    categorical_cols = columns_profile.index[columns_profile['kind'] == "text"].tolist()
+    datetime_cols = columns_profile.index[columns_profile['kind'] == "datetime"].tolist()
     
     if template_choice != "Template Personalizzato":
         st.markdown("#### 🎛️ Configura il Template")